@@ -0,0 +1,194 @@
+import argparse
+import datetime
+import json
+import math
+import multiprocessing
+import os
+import platform
+import random
+import statistics
+import tempfile
+import time
+import tracemalloc
+
+import yaml
+
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Mapping, Optional
+
+from divider import RENDER_CACHE, STATS, YAML_LOADER, Divider, DividerPDF
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+SOURCE_DECK = "cards.yaml"
+DEFAULT_SIZES = [100, 1000, 10000]
+RESULTS_FILE = "output/benchmarks.jsonl"
+# FPDF holds every encoded page until output(), a few MB each, so larger decks only encode an even sample of pages.
+PDF_SAMPLE_PAGES = 100
+COLORS = ["Y", "U", "B", "R", "G", "YU", "UB", "BR", "RG", "GY", "YB", "UR", "BG", "RY", "GU"]
+RARITIES = ["common1", "common2", "uncommon", "rare"]
+ANCHORS = ["hero", "hero", "hero", "villain", "henchmen", "mastermind"]
+
+
+def collect_names(source_deck: str) -> Dict[str, List[str]]:
+    with open(source_deck) as source_file:
+        data = yaml.load(source_file, Loader=YAML_LOADER)
+    teams = set()
+    themes = set()
+    for card in data["cards"]:
+        teams.update(card.get("teams") or [])
+        themes.update(card.get("themes") or [])
+    icons = {name[:-4] for name in os.listdir("resources/icons") if name.endswith(".png")}
+    images = sorted(name[:-4] for name in os.listdir("resources/images") if name.endswith(".png"))
+    return {"teams": sorted(team for team in teams if team in icons), "themes": sorted(themes), "images": images}
+
+
+def generate_deck(size: int, path: str, source_deck: str = SOURCE_DECK, seed: int = 0):
+    # Reuses the boilerplate anchors and layout of the real deck, so only the card list is synthetic.
+    with open(source_deck) as source_file:
+        header = source_file.read().split("\ncards:")[0]
+    names = collect_names(source_deck)
+    rng = random.Random(seed)
+    lines = [header, "cards:"]
+    for i in range(size):
+        anchor = rng.choice(ANCHORS)
+        lines.append(f"  - name: {json.dumps(f'{anchor.title()} {i}')}")
+        lines.append(f"    <<: *{anchor}")
+        lines.append(f"    image: {json.dumps(rng.choice(names['images']))}")
+        if anchor == "hero":
+            for rarity in RARITIES:
+                lines.append(f"    {rarity}:")
+                lines.append(f"      color: \"{rng.choice(COLORS)}\"")
+                lines.append(f"      cost: \"{rng.randint(2, 8)}\"")
+            lines.append(f"    teams: {json.dumps(rng.sample(names['teams'], rng.randint(1, 2)))}")
+        lines.append(f"    themes: {json.dumps(rng.sample(names['themes'], rng.randint(1, 6)))}")
+    with open(path, "w") as deck_file:
+        deck_file.write("\n".join(lines) + "\n")
+
+
+def summarize(durations: List[float]) -> Dict[str, float]:
+    if not durations:
+        return {"count": 0, "total": 0.0}
+    return {"count": len(durations), "total": sum(durations), "mean": statistics.mean(durations),
+            "median": statistics.median(durations), "max": max(durations)}
+
+
+def peak_rss_megabytes(children: bool = False) -> float:
+    # The high-water mark of the process, or of the largest of its finished worker processes.
+    if resource is None:
+        return 0.0
+    peak = resource.getrusage(resource.RUSAGE_CHILDREN if children else resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes.
+    return peak / (1024 * 1024 if platform.system() == "Darwin" else 1024)
+
+
+def stage_timings(category: str, prefix: str = "") -> List[float]:
+    # STATS keeps a count and total per name, cards are named uniquely in the generated decks.
+    durations = []
+    for (entry_category, name), (count, total, _) in STATS.timings.items():
+        if entry_category == category and name.startswith(prefix):
+            durations.extend([total / count] * count)
+    return durations
+
+
+def run_benchmark(deck: str, trace_memory: bool = False, pdf_pages: int = PDF_SAMPLE_PAGES,
+                  overrides: Optional[Mapping] = None) -> Mapping:
+    if trace_memory:
+        # Exact Python-side peak, at the cost of slowing every stage down.
+        tracemalloc.start()
+    with tempfile.TemporaryDirectory() as cache_directory:
+        # The first load parses the YAML and fills a throwaway deck cache, the second is what a repeat run costs.
+        start = time.perf_counter()
+        Divider.load(deck, cache_directory)
+        load_time = time.perf_counter() - start
+        start = time.perf_counter()
+        dividers, global_properties = Divider.load(deck, cache_directory)
+        cached_load_time = time.perf_counter() - start
+    global_properties.update({key: value for key, value in (overrides or {}).items() if value is not None})
+    # The pages are built by Divider.iter_pages as in main(), so the render cache, worker pool and prefetching are
+    # part of what is measured, and the stage timings come from the instrumentation main() reports with --stats.
+    STATS.level = "summary"
+    STATS.drain()
+    RENDER_CACHE.clear()
+    RENDER_CACHE.max_size = global_properties["render_cache_size"]
+    pdf = DividerPDF('P', "in", "Letter")
+    flipped_pdf = DividerPDF('P', "in", "Letter")
+    pdf.output_options = flipped_pdf.output_options = Divider.output_options(global_properties)
+    pages = list(Divider.page_placements(len(dividers), global_properties))
+    # Fronts and backs are sampled together, so both documents of a double sided deck get pages.
+    per_sheet = 2 if global_properties["double_sided"] else 1
+    step = math.ceil(len(pages) / pdf_pages) if pdf_pages > 0 else 1
+    start = time.perf_counter()
+    for page_index, page in enumerate(Divider.iter_pages(dividers, global_properties, pages=pages)):
+        if page_index // per_sheet % step == 0:
+            document = flipped_pdf if global_properties["double_sided"] and global_properties["separate_docs"] \
+                and page_index % 2 == 1 else pdf
+            with STATS.timer("page", f"pdf {page_index}"):
+                page = Divider.prepare_page(page, global_properties)
+                document.add_page()
+                document.image_pil(page, 0, 0, 8.5, 11)
+    pages_time = time.perf_counter() - start
+    with tempfile.TemporaryDirectory() as output_directory:
+        start = time.perf_counter()
+        pdf.output(os.path.join(output_directory, "dividers.pdf"))
+        if global_properties["double_sided"] and global_properties["separate_docs"]:
+            flipped_pdf.output(os.path.join(output_directory, "dividers_flipped.pdf"))
+        write_time = time.perf_counter() - start
+    traced_peak = 0
+    if trace_memory:
+        _, traced_peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    encode_times = stage_timings("page", "pdf ")
+    result = {"cards": len(dividers), "pages": len(pages), "workers": global_properties["workers"],
+              "load": load_time, "cached_load": cached_load_time, "build": pages_time,
+              "render": summarize(stage_timings("card")), "compose": summarize(stage_timings("page", "compose ")),
+              "render_cache": {"rendered": RENDER_CACHE.misses, "reused": RENDER_CACHE.hits},
+              "pdf": {"pages": len(encode_times), "encode": summarize(encode_times), "write": write_time},
+              "peak_memory_mb": {"python": traced_peak / (1024 * 1024), "process": peak_rss_megabytes(),
+                                 "workers": peak_rss_megabytes(children=True)}}
+    STATS.drain()
+    STATS.level = "off"
+    return result
+
+
+def main(sizes: List[int], results_file: str, keep_decks: bool, seed: int, trace_memory: bool,
+         pdf_pages: int = PDF_SAMPLE_PAGES, workers: Optional[int] = None):
+    for directory in (os.path.dirname(results_file), "output" if keep_decks else None):
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+    with tempfile.TemporaryDirectory() as deck_directory:
+        for size in sizes:
+            deck = os.path.join("output" if keep_decks else deck_directory, f"benchmark_{size}.yaml")
+            generate_deck(size, deck, seed=seed)
+            print(f"Benchmarking {size} cards")
+            # Each deck gets a fresh process, since the peak memory of a process only ever grows.
+            with ProcessPoolExecutor(1, mp_context=multiprocessing.get_context("spawn")) as executor:
+                result = executor.submit(run_benchmark, deck, trace_memory, pdf_pages, {"workers": workers}).result()
+            result.update({"timestamp": datetime.datetime.now().isoformat(timespec="seconds"), "deck_size": size,
+                           "seed": seed, "python": platform.python_version(), "platform": platform.platform()})
+            print(f"  load {result['load']:.2f}s ({result['cached_load']:.2f}s cached), "
+                  f"render {result['render']['total']:.2f}s ({result['render']['mean'] * 1000:.1f}ms/divider), "
+                  f"compose {result['compose']['total']:.2f}s, {result['build']:.2f}s for all pages with "
+                  f"{result['render_cache']['reused']} dividers reused, "
+                  f"pdf {result['pdf']['encode']['total'] + result['pdf']['write']:.2f}s "
+                  f"({result['pdf']['pages']} of {result['pages']} pages), "
+                  f"peak {result['peak_memory_mb']['process']:.0f}MB")
+            with open(results_file, "a") as results:
+                results.write(json.dumps(result) + "\n")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Time the divider pipeline on synthetic decks.")
+    parser.add_argument("sizes", nargs="*", type=int, default=DEFAULT_SIZES, help="number of cards per deck")
+    parser.add_argument("--results", default=RESULTS_FILE, help="JSON lines file the results are appended to")
+    parser.add_argument("--keep-decks", action="store_true", help="leave the generated decks in output/")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--pdf-pages", type=int, default=PDF_SAMPLE_PAGES,
+                        help="encode about this many evenly spaced pages into the PDF, 0 for every page")
+    parser.add_argument("--workers", type=int, help="render with this many processes instead of the deck's setting")
+    parser.add_argument("--trace-memory", action="store_true", help="also record the Python heap peak (slower)")
+    args = parser.parse_args()
+    main(args.sizes, args.results, args.keep_decks, args.seed, args.trace_memory, args.pdf_pages, args.workers)
@@ -1,24 +1,1064 @@
+import argparse
+import contextlib
+import cProfile
+import glob
+import hashlib
+import io
+import json
 import math
+import multiprocessing
 import os
+import pickle
+import pstats
+import queue
+import re
+import struct
+import sys
 import textwrap
+import threading
+import time
+import zlib
 
 import yaml
 
-from collections import Counter
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 from fpdf import FPDF
-from PIL import Image, ImageDraw, ImageFont
-from typing import List, Mapping, Tuple, Union
+from PIL import Image, ImageColor, ImageDraw, ImageFont
+from typing import Callable, Dict, Hashable, Iterator, List, Mapping, Optional, Tuple, Union
+
+
+COLOR_VALUE = {"Y": 0, "U": 1, "B": 2, "R": 3, "G": 4, "YU": 5, "UB": 6, "BR": 7, "RG": 8, "GY": 9, "YB": 10, "UR": 11,
+               "BG": 12, "RY": 13, "GU": 14, "E": 15, "W": 16}
+COLOR_TO_COLOR = {"Y": "#dea319", "U": "#01a1d5", "B": "#a6a8ab", "R": "#b32f40", "G": "#46b650", "E": "#7e8184",
+                  "W": "White"}
+# libyaml's loader is several times faster on the anchor-heavy decks, but is not built into every PyYAML install.
+YAML_LOADER = getattr(yaml, "CFullLoader", yaml.FullLoader)
+# Bump whenever Divider.parse or the layout nodes change shape, so stale parsed decks in cache/decks are ignored.
+DECK_CACHE_VERSION = 5
+RENDER_CACHE_SIZE = 64
+OUTPUT_MODES = ("RGB", "P", "L")
+OUTPUT_ENCODINGS = ("png", "jpeg", "flate")
+OUTPUT_KEYS = ("output_mode", "output_dpi", "output_encoding", "jpeg_quality", "compress_level")
+
+
+class Instrumentation:
+    # Counters and timers for the render pipeline. "summary" only aggregates, "trace" also prints every event.
+    LEVELS = ("off", "summary", "trace")
+
+    def __init__(self, level: str = "off"):
+        self.level = level
+        self.timings: Dict[Tuple[str, str], List[float]] = {}
+
+    @property
+    def level(self) -> str:
+        return self._level
+
+    @level.setter
+    def level(self, level: str):
+        if level not in self.LEVELS:
+            raise Exception(f"Unknown instrumentation level {level}, expected one of {', '.join(self.LEVELS)}")
+        self._level = level
+        self.enabled = level != "off"
+        self.tracing = level == "trace"
+
+    def trace(self, message: str, *args):
+        # Formatting is deferred so the disabled path costs a single attribute check.
+        if self.tracing:
+            print(message % args if args else message)
+
+    def record(self, category: str, name: str, duration: float):
+        entry = self.timings.get((category, name))
+        if entry is None:
+            entry = self.timings[(category, name)] = [0, 0.0, 0.0]
+        entry[0] += 1
+        entry[1] += duration
+        entry[2] = max(entry[2], duration)
+        if self.tracing:
+            print(f"{category} {name}: {duration * 1000:.2f}ms")
+
+    @contextlib.contextmanager
+    def timer(self, category: str, name: str):
+        if not self.enabled:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(category, name, time.perf_counter() - start)
+
+    def merge(self, timings: Mapping[Tuple[str, str], List[float]]):
+        for key, (count, total, longest) in timings.items():
+            entry = self.timings.setdefault(key, [0, 0.0, 0.0])
+            entry[0] += count
+            entry[1] += total
+            entry[2] = max(entry[2], longest)
+
+    def drain(self) -> Dict[Tuple[str, str], List[float]]:
+        timings = self.timings
+        self.timings = {}
+        return timings
+
+    def report(self, top: int = 10) -> str:
+        lines = []
+        for category in sorted({category for category, _ in self.timings}):
+            entries = sorted(((name, entry) for (entry_category, name), entry in self.timings.items()
+                              if entry_category == category), key=lambda item: item[1][1], reverse=True)
+            lines.append(f"{category} ({len(entries)} timed, slowest first):")
+            for name, (count, total, longest) in entries[:top]:
+                lines.append(f"  {name:<40} {count:>6}x  total {total:8.3f}s  mean {total / count * 1000:8.2f}ms  "
+                             f"max {longest * 1000:8.2f}ms")
+        return "\n".join(lines)
+
+
+STATS = Instrumentation()
+
+
+class Tally:
+    # A multiset of property values as value -> count in first seen order. It iterates like the repeated list it
+    # replaces, but rarity expansion and the colorbar only ever touch one entry per distinct value.
+    __slots__ = ("counts",)
+
+    def __init__(self, counts: Optional[Mapping[str, int]] = None):
+        self.counts: Dict[str, int] = dict(counts or {})
+
+    @classmethod
+    def of(cls, values) -> "Tally":
+        if isinstance(values, Tally):
+            return cls(values.counts)
+        tally = cls()
+        for value in values:
+            tally.add(value)
+        return tally
+
+    def add(self, value, count: int = 1):
+        if count > 0:
+            self.counts[value] = self.counts.get(value, 0) + count
+
+    def items(self) -> Iterator[Tuple[str, int]]:
+        return iter(self.counts.items())
+
+    def __iter__(self):
+        for value, count in self.counts.items():
+            for _ in range(count):
+                yield value
+
+    def __len__(self) -> int:
+        return sum(self.counts.values())
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, Tally) and self.counts == other.counts
+
+    def __repr__(self) -> str:
+        # Also what Divider.fingerprint serializes, so it has to stay deterministic.
+        return f"Tally({self.counts!r})"
+
+
+class LayoutNode:
+    # A format entry checked and converted once at load time. "auto" positions and sizes are stored as None.
+    __slots__ = ("type", "x", "y", "width", "height", "property", "required")
+    required_keys: Tuple[str, ...] = ("position", "size")
+    fixed_size = False
+
+    def __init__(self, draw_property: Mapping, path: str):
+        missing = [key for key in self.required_keys if key not in draw_property]
+        if missing:
+            raise Exception(f"Missing {', '.join(missing)} in {draw_property['type']} at {path}")
+        self.type = draw_property["type"]
+        x, y = self._pair(draw_property, "position", path)
+        width, height = self._pair(draw_property, "size", path)
+        self.x = self._dimension(x, "position", path)
+        self.y = self._dimension(y, "position", path)
+        self.width = self._dimension(width, "size", path)
+        self.height = self._dimension(height, "size", path)
+        if self.fixed_size and (self.width is None or self.height is None):
+            raise Exception(f"{self.type} at {path} does not support auto sizing")
+        self.property = draw_property.get("property")
+        self.required = bool(draw_property.get("required", False))
+
+    @staticmethod
+    def _pair(draw_property: Mapping, key: str, path: str) -> Tuple:
+        value = draw_property.get(key, (0, 0))
+        if not isinstance(value, (list, tuple)) or len(value) != 2:
+            raise Exception(f"Expected two values for {key} at {path}, got {value}")
+        return tuple(value)
+
+    @staticmethod
+    def _dimension(value: Union[int, str], key: str, path: str) -> Optional[int]:
+        if value == "auto":
+            return None
+        try:
+            return int(value)
+        except (TypeError, ValueError):
+            raise Exception(f"Invalid {key} value {value!r} at {path}, expected a number or auto") from None
+
+    def resolve_position(self, current_x: int, current_y: int) -> Tuple[int, int]:
+        return current_x if self.x is None else self.x, current_y if self.y is None else self.y
+
+    def fonts(self) -> Iterator[Tuple[str, int]]:
+        return iter(())
+
+    def __repr__(self) -> str:
+        fields = ", ".join(f"{name}={getattr(self, name)!r}" for cls in type(self).__mro__
+                           for name in getattr(cls, "__slots__", ()) if name != "children")
+        return f"{type(self).__name__}({fields})"
+
+
+class ContainerNode(LayoutNode):
+    __slots__ = ("spacing", "backwards", "children")
+    required_keys = LayoutNode.required_keys + ("spacing", "backwards", "properties")
+
+    def __init__(self, draw_property: Mapping, path: str):
+        super().__init__(draw_property, path)
+        self.spacing = int(draw_property["spacing"])
+        self.backwards = bool(draw_property["backwards"])
+        self.children = compile_layout(draw_property["properties"], path)
+
+    def render(self, divider: "Divider", result: Image, draw: ImageDraw,
+               bounding_box: Tuple[Tuple[int, int], Tuple[int, int]], current_x: int, current_y: int,
+               backwards: bool) -> Tuple[int, int]:
+        return divider.render_container(result, draw, self, bounding_box, current_x, current_y, backwards)
+
+
+class TextNode(LayoutNode):
+    __slots__ = ("background_property", "background_default", "text_color_property", "text_color_default", "font",
+                 "font_size", "centered_width", "centered_height")
+    required_keys = LayoutNode.required_keys + ("property", "background_property", "background_default",
+                                                "text_color_property", "text_color_default", "font", "font_size",
+                                                "centered_width", "centered_height")
+
+    def __init__(self, draw_property: Mapping, path: str):
+        super().__init__(draw_property, path)
+        self.background_property = draw_property["background_property"]
+        self.background_default = draw_property["background_default"]
+        self.text_color_property = draw_property["text_color_property"]
+        self.text_color_default = draw_property["text_color_default"]
+        self.font = draw_property["font"]
+        self.font_size = int(draw_property["font_size"])
+        self.centered_width = bool(draw_property["centered_width"])
+        self.centered_height = bool(draw_property["centered_height"])
+
+    def fonts(self) -> Iterator[Tuple[str, int]]:
+        yield self.font, self.font_size
+
+    def render(self, divider: "Divider", result: Image, draw: ImageDraw,
+               bounding_box: Tuple[Tuple[int, int], Tuple[int, int]], current_x: int, current_y: int,
+               backwards: bool) -> Tuple[int, int]:
+        return divider.render_text(result, draw, self, bounding_box, current_x, current_y, backwards)
+
+
+class ListNode(LayoutNode):
+    __slots__ = ("icons", "text", "orientation", "rows", "columns", "spacing", "centered_width", "centered_height",
+                 "text_color_property", "text_color_default", "font", "font_size", "bulleted", "wrap")
+    required_keys = LayoutNode.required_keys + ("property", "orientation", "rows", "columns", "spacing",
+                                                "centered_width", "centered_height")
+    text_keys = ("text_color_property", "text_color_default", "font", "font_size", "bulleted", "wrap")
+
+    def __init__(self, draw_property: Mapping, path: str):
+        super().__init__(draw_property, path)
+        self.icons = "icon" in self.type
+        self.text = "text" in self.type
+        if not self.icons and not self.text:
+            raise Exception(f"Unsupported list type {self.type} at {path}, expected icons and/or text")
+        if self.text:
+            missing = [key for key in self.text_keys if key not in draw_property]
+            if missing:
+                raise Exception(f"Missing {', '.join(missing)} in {self.type} at {path}")
+        self.orientation = draw_property["orientation"]
+        if self.orientation not in ("horizontal", "vertical"):
+            raise Exception(f"Unsupported orientation {self.orientation} at {path}")
+        self.rows = draw_property["rows"]
+        self.columns = draw_property["columns"]
+        for key, value in (("rows", self.rows), ("columns", self.columns)):
+            if value is not None and (not isinstance(value, int) or value < 1):
+                raise Exception(f"Invalid {key} value {value!r} at {path}, expected a positive number or null")
+        self.spacing = int(draw_property["spacing"])
+        self.centered_width = bool(draw_property["centered_width"])
+        self.centered_height = bool(draw_property["centered_height"])
+        self.text_color_property = draw_property.get("text_color_property")
+        self.text_color_default = draw_property.get("text_color_default")
+        self.font = draw_property.get("font")
+        self.font_size = int(draw_property["font_size"]) if self.text else None
+        self.bulleted = bool(draw_property.get("bulleted", False))
+        self.wrap = draw_property.get("wrap")
+
+    def fonts(self) -> Iterator[Tuple[str, int]]:
+        if self.text:
+            yield self.font, self.font_size
+
+    def render(self, divider: "Divider", result: Image, draw: ImageDraw,
+               bounding_box: Tuple[Tuple[int, int], Tuple[int, int]], current_x: int, current_y: int,
+               backwards: bool) -> Tuple[int, int]:
+        return divider.render_list(result, draw, self, bounding_box, current_x, current_y, backwards)
+
+
+class ColorbarNode(LayoutNode):
+    __slots__ = ()
+    required_keys = ("property", "size")
+    fixed_size = True
+
+    def render(self, divider: "Divider", result: Image, draw: ImageDraw,
+               bounding_box: Tuple[Tuple[int, int], Tuple[int, int]], current_x: int, current_y: int,
+               backwards: bool) -> Tuple[int, int]:
+        return divider.render_colorbar(result, draw, self, bounding_box, current_x, current_y, backwards)
+
+
+class ImageNode(LayoutNode):
+    __slots__ = ()
+    required_keys = LayoutNode.required_keys + ("property",)
+    fixed_size = True
+
+    def render(self, divider: "Divider", result: Image, draw: ImageDraw,
+               bounding_box: Tuple[Tuple[int, int], Tuple[int, int]], current_x: int, current_y: int,
+               backwards: bool) -> Tuple[int, int]:
+        return divider.render_image(result, draw, self, bounding_box, current_x, current_y, backwards)
+
+
+def compile_layout(draw_properties: List[Mapping], path: str = "format") -> List[LayoutNode]:
+    nodes = []
+    for i, draw_property in enumerate(draw_properties):
+        node_path = f"{path}.properties[{i}]"
+        node_type = draw_property.get("type")
+        if node_type == "container":
+            nodes.append(ContainerNode(draw_property, node_path))
+        elif node_type == "text":
+            nodes.append(TextNode(draw_property, node_path))
+        elif isinstance(node_type, str) and node_type.startswith("list["):
+            nodes.append(ListNode(draw_property, node_path))
+        elif node_type == "colorbar":
+            nodes.append(ColorbarNode(draw_property, node_path))
+        elif node_type == "image":
+            nodes.append(ImageNode(draw_property, node_path))
+        else:
+            raise Exception(f"Unsupported type {node_type} in property {draw_property} at {node_path}")
+    return nodes
+
+
+def walk_layout(nodes: List[LayoutNode]) -> Iterator[LayoutNode]:
+    for node in nodes:
+        yield node
+        if isinstance(node, ContainerNode):
+            yield from walk_layout(node.children)
+
+
+def image_bytes(image: Image.Image) -> int:
+    return image.size[0] * image.size[1] * len(image.getbands())
+
+
+class RenderCache:
+    def __init__(self, max_size: int = RENDER_CACHE_SIZE, max_bytes: Optional[int] = None):
+        self.max_size = max_size
+        # Optional bound on the pixel data held, for long running processes where max_size alone says little.
+        self.max_bytes = max_bytes
+        self.entries: "OrderedDict[str, Image.Image]" = OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, divider: "Divider") -> str:
+        return divider.fingerprint()
+
+    def lookup(self, key: str) -> Optional[Image.Image]:
+        image = self.entries.get(key)
+        if image is not None:
+            self.entries.move_to_end(key)
+            self.hits += 1
+        else:
+            self.misses += 1
+        return image
+
+    def store(self, key: str, image: Image.Image):
+        if self.max_size > 0:
+            previous = self.entries.pop(key, None)
+            if previous is not None:
+                self.size -= image_bytes(previous)
+            self.entries[key] = image
+            self.size += image_bytes(image)
+            while len(self.entries) > self.max_size or \
+                    (self.max_bytes is not None and self.size > self.max_bytes and len(self.entries) > 1):
+                _, evicted = self.entries.popitem(last=False)
+                self.size -= image_bytes(evicted)
+
+    def get(self, divider: "Divider") -> Image.Image:
+        key = self.key(divider)
+        image = self.lookup(key)
+        if image is None:
+            image = divider.render()
+            self.store(key, image)
+        return image
+
+    def clear(self):
+        self.entries.clear()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+
+    def __str__(self) -> str:
+        return f"Render cache: {self.hits} hits, {self.misses} misses, {len(self.entries)}/{self.max_size} entries"
+
+
+RENDER_CACHE = RenderCache()
+
+PAGE_LAYOUT_KEYS = ("grid_lines", "grid_width", "grid_spacing", "page_width", "page_height", "divider_width",
+                    "divider_height", "margin_width", "margin_height")
+
+
+class PageTemplates:
+    # Blank pages with the cut marks of a set of slots already drawn. Every full front and back of a deck uses the
+    # same slots, so a run normally builds one or two templates and then only copies them.
+    def __init__(self, max_size: int = 8):
+        self.max_size = max_size
+        self.entries: "OrderedDict[Tuple, Tuple[Image.Image, bool]]" = OrderedDict()
+
+    def get(self, slots: List[Tuple[int, int, int, int]], global_properties: Mapping) -> Tuple[Image.Image, bool]:
+        # slots are (x, y, width, height) of the tiles. The flag is False when a cut mark would land on a tile, in
+        # which case the template is left blank and the marks have to be drawn in between the pastes as before.
+        key = (tuple(global_properties[name] for name in PAGE_LAYOUT_KEYS), tuple(sorted(slots)))
+        entry = self.entries.get(key)
+        if entry is not None:
+            self.entries.move_to_end(key)
+            return entry
+        template = Image.new("RGBA", (global_properties["page_width"], global_properties["page_height"]),
+                             color="White")
+        marks = [line for x, y, _, _ in slots for line in Divider.cut_marks(x, y, global_properties)] \
+            if global_properties["grid_lines"] else []
+        reach = global_properties["grid_width"] // 2 + 1
+        separate = not any(min(x1, x2) - reach < x + width and max(x1, x2) + reach > x and
+                           min(y1, y2) - reach < y + height and max(y1, y2) + reach > y
+                           for (x1, y1), (x2, y2) in marks for x, y, width, height in slots)
+        if separate:
+            draw = ImageDraw.Draw(template)
+            for line in marks:
+                draw.line(line, fill="Black", width=global_properties["grid_width"])
+        entry = (template, separate)
+        self.entries[key] = entry
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+        return entry
+
+
+PAGE_TEMPLATES = PageTemplates()
+
+
+class SingleFlight:
+    # Guards a cache that is filled from several threads. Loads of different keys run in parallel, a second request
+    # for a key that is being loaded waits for that load instead of repeating it.
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.loading: Dict[Hashable, threading.Event] = {}
+
+    def get(self, key: Hashable, lookup: Callable[[], Optional[object]], load: Callable[[], object],
+            store: Callable[[object], None]):
+        while True:
+            with self.lock:
+                value = lookup()
+                if value is not None:
+                    return value
+                event = self.loading.get(key)
+                if event is None:
+                    event = self.loading[key] = threading.Event()
+                    break
+            event.wait()
+        try:
+            value = load()
+            with self.lock:
+                store(value)
+            return value
+        finally:
+            with self.lock:
+                del self.loading[key]
+            event.set()
+
+
+class FontRegistry:
+    def __init__(self, measurement_cache_size: int = 4096):
+        self.fonts: Dict[Tuple[str, int], ImageFont.FreeTypeFont] = {}
+        # Text size only depends on the font, so one scratch canvas can measure for every divider.
+        self._draw = ImageDraw.Draw(Image.new("RGBA", (1, 1)))
+        self.textsize = lru_cache(maxsize=measurement_cache_size)(self._textsize)
+        self.flight = SingleFlight()
+
+    def get(self, path: str, size: int) -> ImageFont.FreeTypeFont:
+        font = self.fonts.get((path, size))
+        if font is not None:
+            return font
+        return self.flight.get((path, size), lambda: self.fonts.get((path, size)),
+                               lambda: ImageFont.truetype(path, size),
+                               lambda loaded: self.fonts.__setitem__((path, size), loaded))
+
+    def _textsize(self, text: str, path: str, size: int, multiline: bool = False) -> Tuple[int, int]:
+        if multiline:
+            return self._draw.multiline_textsize(text, self.get(path, size))
+        return self._draw.textsize(text, self.get(path, size))
+
+    def forget(self, paths: set):
+        # Drops fonts whose files changed on disk, along with every measurement, which cannot be told apart by file.
+        changed = [key for key in self.fonts if os.path.normpath(key[0]) in paths]
+        for key in changed:
+            del self.fonts[key]
+        if changed:
+            self.textsize.cache_clear()
+
+    def preload(self, plan: List[LayoutNode]):
+        for node in walk_layout(plan):
+            for path, size in node.fonts():
+                self.get(path, size)
+
+
+FONTS = FontRegistry()
+
+
+class IconStore:
+    def __init__(self, directory: str = "resources/icons", max_size: int = 512):
+        self.directory = directory
+        self.max_size = max_size
+        self.entries: "OrderedDict[Tuple[str, int], Image.Image]" = OrderedDict()
+        self._index: Optional[Dict[str, Tuple[str, float]]] = None
+        self.flight = SingleFlight()
+
+    @property
+    def index(self) -> Dict[str, Tuple[str, float]]:
+        # One directory listing replaces an isfile call for every team and theme of every card. Names are matched
+        # ignoring case, like isfile does on Windows and macOS, as decks refer to avengers.png as Avengers.
+        if self._index is None:
+            self._index = {}
+            with os.scandir(self.directory) as entries:
+                for entry in sorted(entries, key=lambda entry: entry.name):
+                    if entry.name.lower().endswith(".png") and entry.is_file():
+                        self._index.setdefault(entry.name[:-4].lower(), (entry.name, entry.stat().st_mtime))
+        return self._index
+
+    def refresh(self):
+        self._index = None
+        self.entries.clear()
+
+    def exists(self, name: str) -> bool:
+        return name.lower() in self.index
+
+    def path(self, name: str) -> str:
+        entry = self.index.get(name.lower())
+        return f"{self.directory}/{entry[0] if entry is not None else f'{name}.png'}"
+
+    def modified(self, name: str) -> Optional[float]:
+        entry = self.index.get(name.lower())
+        return entry[1] if entry is not None else None
+
+    def get(self, name: str, height: int) -> Image.Image:
+        name = name.lower()
+        return self.flight.get((name, height), lambda: self._lookup(name, height), lambda: self._load(name, height),
+                               lambda icon: self._store(name, height, icon))
+
+    def _lookup(self, name: str, height: int) -> Optional[Image.Image]:
+        icon = self.entries.get((name, height))
+        if icon is not None:
+            self.entries.move_to_end((name, height))
+        return icon
+
+    def _load(self, name: str, height: int) -> Image.Image:
+        icon = Image.open(self.path(name))
+        icon_width, icon_height = icon.size
+        icon = icon.resize((height * icon_width // icon_height, height), Image.HAMMING)
+        icon.info["source"] = f"{self.path(name)}@{height}"
+        return icon
+
+    def _store(self, name: str, height: int, icon: Image.Image):
+        self.entries[(name, height)] = icon
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+    @staticmethod
+    def atlas_paths(height: int) -> Tuple[str, str]:
+        return f"cache/icons_{height}.png", f"cache/icons_{height}.json"
+
+    def save_atlas(self, height: int):
+        icons = [(name, icon) for (name, icon_height), icon in self.entries.items() if icon_height == height]
+        if not icons:
+            return
+        image_path, index_path = self.atlas_paths(height)
+        if not os.path.exists("cache"):
+            os.makedirs("cache")
+        atlas = Image.new("RGBA", (sum(icon.size[0] for _, icon in icons), height), (0, 0, 0, 0))
+        atlas_index = {}
+        x = 0
+        for name, icon in icons:
+            atlas.paste(icon, (x, 0))
+            atlas_index[name] = [x, icon.size[0], self.modified(name)]
+            x += icon.size[0]
+        atlas.save(image_path)
+        with open(index_path, "w") as index_file:
+            json.dump(atlas_index, index_file)
+
+    def load_atlas(self, height: int):
+        image_path, index_path = self.atlas_paths(height)
+        if not os.path.exists(image_path) or not os.path.exists(index_path):
+            return
+        with open(index_path) as index_file:
+            atlas_index = json.load(index_file)
+        atlas = Image.open(image_path)
+        atlas.load()
+        for name, (x, width, mtime) in atlas_index.items():
+            # Icons edited since the atlas was written are left to be scaled again from the source file.
+            if self.modified(name) == mtime:
+                icon = atlas.crop((x, 0, x + width, height))
+                icon.info["source"] = f"{self.path(name)}@{height}"
+                self._store(name.lower(), height, icon)
+
+
+ICONS = IconStore()
+
+
+class ArtStore:
+    # Decoded card art by name. One image is the size of a few hundred icons, so the bound is on bytes, not count.
+    def __init__(self, directory: str = "resources/images", max_bytes: int = 64 * 1024 * 1024):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.entries: "OrderedDict[str, Tuple[int, Image.Image]]" = OrderedDict()
+        self.size = 0
+        self.flight = SingleFlight()
+
+    def path(self, name: str) -> str:
+        return f"{self.directory}/{name}.png"
+
+    def get(self, name: str) -> Optional[Image.Image]:
+        path = self.path(name)
+        try:
+            modified = os.stat(path).st_mtime_ns
+        except OSError:
+            return None
+        return self.flight.get((name, modified), lambda: self._lookup(name, modified), lambda: self._load(path),
+                               lambda image: self.store(name, modified, image))
+
+    def _lookup(self, name: str, modified: int) -> Optional[Image.Image]:
+        entry = self.entries.get(name)
+        if entry is None or entry[0] != modified:
+            return None
+        self.entries.move_to_end(name)
+        return entry[1]
+
+    @staticmethod
+    def _load(path: str) -> Image.Image:
+        image = Image.open(path)
+        image.load()
+        return image
+
+    def store(self, name: str, modified: int, image: Image.Image):
+        previous = self.entries.pop(name, None)
+        if previous is not None:
+            self.size -= image_bytes(previous[1])
+        self.entries[name] = (modified, image)
+        self.size += image_bytes(image)
+        while self.size > self.max_bytes and len(self.entries) > 1:
+            _, (_, evicted) = self.entries.popitem(last=False)
+            self.size -= image_bytes(evicted)
+
+    def clear(self):
+        self.entries.clear()
+        self.size = 0
+
+
+ART = ArtStore()
+
+
+class DividerPDF(FPDF):
+    # FPDF's idea of the PDF graphics state, saved and restored with q and Q around clipped drawing.
+    GRAPHICS_STATE = ("font_family", "font_style", "font_size_pt", "font_size", "current_font", "draw_color",
+                      "fill_color", "text_color", "color_flag", "line_width")
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # encode_image keyword arguments for every image placed with image_pil, see Divider.output_options.
+        self.output_options: Dict = {}
+        self._clip_states: List[Dict] = []
+
+    def use_font(self, path: str, size: float):
+        family = os.path.splitext(os.path.basename(path))[0]
+        if family.lower() not in self.fonts:
+            self.add_font(family, "", path, uni=True)
+        self.set_font(family, "", size)
+
+    def clip_rect(self, x: float, y: float, w: float, h: float):
+        # FPDF has no clipping API, everything drawn until end_clip is cut to the rectangle.
+        self._clip_states.append({key: getattr(self, key) for key in self.GRAPHICS_STATE if hasattr(self, key)})
+        self._out(f"q {x * self.k:.2f} {(self.h - y) * self.k:.2f} {w * self.k:.2f} {-h * self.k:.2f} re W n")
+
+    def end_clip(self):
+        # Q also restores the font, colours and line width, so FPDF has to forget what was selected inside the clip
+        # or it skips selecting the same font again and writes text with no font set.
+        self._out("Q")
+        for key, value in self._clip_states.pop().items():
+            setattr(self, key, value)
+
+    def image_pil(self, image: Image.Image, x: float, y: float, w: float, h: float, name: Optional[str] = None):
+        # FPDF only reads images from files, so register the pixels directly under a generated name instead of
+        # writing them out and having FPDF parse them back in.
+        if name is None or name not in self.images:
+            self.image_info(self.encode_image(image, **self.output_options), x, y, w, h, name)
+        else:
+            self.image(name, x, y, w, h)
+
+    def image_info(self, info: Dict, x: float, y: float, w: float, h: float, name: Optional[str] = None):
+        if name is None:
+            name = f"__pil_image_{len(self.images)}"
+        if name not in self.images:
+            # FPDF drops the data once it is written, so keep the caller's copy intact.
+            info = dict(info, i=len(self.images) + 1)
+            self.images[name] = info
+        self.image(name, x, y, w, h)
+
+    @staticmethod
+    def convert_mode(image: Image.Image, mode: str = "RGB") -> Image.Image:
+        if mode not in OUTPUT_MODES:
+            raise Exception(f"Unknown output mode {mode}, expected one of {', '.join(OUTPUT_MODES)}")
+        if image.mode == mode and "transparency" not in image.info:
+            return image
+        if image.mode in ("RGBA", "LA", "P"):
+            # Transparent pixels show the white paper in print, so flatten onto white rather than embed a mask.
+            rgba = image.convert("RGBA")
+            image = Image.new("RGB", image.size, "White")
+            image.paste(rgba, mask=rgba.getchannel("A"))
+        elif image.mode != "RGB":
+            image = image.convert("RGB")
+        if mode == "L":
+            image = image.convert("L")
+        elif mode == "P":
+            # Octree quantizing is an order of magnitude faster than median cut on a full page and looks the same.
+            image = image.quantize(256, method=Image.FASTOCTREE)
+        return image
+
+    @staticmethod
+    def encode_image(image: Image.Image, mode: str = "RGB", encoding: str = "png", quality: int = 85,
+                     compress_level: int = 6) -> Dict:
+        image = DividerPDF.convert_mode(image, mode)
+        if encoding == "jpeg" and image.mode == "P":
+            image = image.convert("RGB")
+        width, height = image.size
+        color_space = {"L": "DeviceGray", "P": "Indexed"}.get(image.mode, "DeviceRGB")
+        info = {"w": width, "h": height, "cs": color_space, "bpc": 8}
+        encoded = io.BytesIO()
+        if encoding == "jpeg":
+            image.save(encoded, "JPEG", quality=quality)
+            info.update(f="DCTDecode", data=encoded.getvalue())
+        elif encoding == "flate":
+            info.update(f="FlateDecode", data=zlib.compress(image.tobytes(), compress_level))
+            if image.mode == "P":
+                info["pal"] = bytes(image.getpalette()[:768])
+        elif encoding == "png":
+            # PNG's per-row filters compress pages far better than plain Flate, and PDF can take the IDAT data as is.
+            image.save(encoded, "PNG", compress_level=compress_level)
+            chunks = DividerPDF.png_chunks(encoded.getvalue())
+            # Pillow packs small palettes into fewer bits per pixel, so take the depth from the header.
+            bits = chunks[b"IHDR"][8]
+            info.update(bpc=bits, f="FlateDecode", data=chunks[b"IDAT"],
+                        dp=f"/Predictor 15 /Colors {3 if image.mode == 'RGB' else 1} /BitsPerComponent {bits} "
+                           f"/Columns {width}")
+            if image.mode == "P":
+                info["pal"] = chunks[b"PLTE"]
+        else:
+            raise Exception(f"Unknown output encoding {encoding}, expected one of {', '.join(OUTPUT_ENCODINGS)}")
+        return info
+
+    @staticmethod
+    def png_chunks(png: bytes) -> Dict[bytes, bytes]:
+        # Chunk type to data, with the IDAT chunks joined into one zlib stream.
+        chunks: Dict[bytes, bytes] = {}
+        position = 8
+        while position < len(png):
+            length, = struct.unpack(">I", png[position:position + 4])
+            chunk_type = png[position + 4:position + 8]
+            if chunk_type == b"IEND":
+                break
+            chunks[chunk_type] = chunks.get(chunk_type, b"") + png[position + 8:position + 8 + length]
+            position += length + 12
+        return chunks
+
+
+class VectorCanvas:
+    # Stands in for both the Image and the ImageDraw passed to the render methods, replaying their drawing calls as
+    # PDF operations in inches. Only pasted images end up as bitmaps.
+    def __init__(self, pdf: DividerPDF, origin_x: int, origin_y: int, scale: float):
+        self.pdf = pdf
+        self.origin_x = origin_x
+        self.origin_y = origin_y
+        self.scale = scale
+
+    def _point(self, x: float, y: float) -> Tuple[float, float]:
+        return (self.origin_x + x) * self.scale, (self.origin_y + y) * self.scale
+
+    @staticmethod
+    def _box(xy) -> Tuple[int, int, int, int]:
+        if len(xy) == 2:
+            (x0, y0), (x1, y1) = xy
+            return x0, y0, x1, y1
+        return tuple(xy)
+
+    @staticmethod
+    def _color(fill) -> Optional[Tuple[int, int, int]]:
+        if fill is None:
+            return None
+        color = ImageColor.getrgb(fill) if isinstance(fill, str) else tuple(fill)
+        if len(color) == 4 and color[3] == 0:
+            return None
+        return color[0], color[1], color[2]
+
+    def rectangle(self, xy, fill=None):
+        color = self._color(fill)
+        if color is not None:
+            x0, y0, x1, y1 = self._box(xy)
+            x, y = self._point(x0, y0)
+            self.pdf.set_fill_color(*color)
+            # Pillow includes the bottom right corner in the rectangle.
+            self.pdf.rect(x, y, (x1 - x0 + 1) * self.scale, (y1 - y0 + 1) * self.scale, "F")
+
+    def ellipse(self, xy, fill=None):
+        color = self._color(fill)
+        if color is not None:
+            x0, y0, x1, y1 = self._box(xy)
+            x, y = self._point(x0, y0)
+            self.pdf.set_fill_color(*color)
+            self.pdf.ellipse(x, y, (x1 - x0 + 1) * self.scale, (y1 - y0 + 1) * self.scale, "F")
+
+    def line(self, xy, fill=None, width=1):
+        color = self._color(fill)
+        if color is not None:
+            x0, y0, x1, y1 = self._box(xy)
+            self.pdf.set_draw_color(*color)
+            self.pdf.set_line_width(width * self.scale)
+            # Pillow's one pixel line covers the pixel, so stroke through its centre.
+            self.pdf.line(*self._point(x0 + 0.5, y0 + 0.5), *self._point(x1 + 0.5, y1 + 0.5))
+
+    def text(self, xy, text, fill=None, font=None):
+        color = self._color(fill)
+        if color is not None:
+            ascent, _ = font.getmetrics()
+            x, y = self._point(xy[0], xy[1] + ascent)
+            self.pdf.set_text_color(*color)
+            self.pdf.use_font(font.path, font.size * self.scale * 72)
+            self.pdf.text(x, y, text)
+
+    def multiline_text(self, xy, text, fill=None, font=None):
+        # Same line spacing as ImageDraw.multiline_text with its default spacing of 4.
+        line_spacing = FONTS.textsize("A", font.path, font.size)[1] + 4
+        for line_number, line in enumerate(text.split("\n")):
+            self.text((xy[0], xy[1] + line_number * line_spacing), line, fill=fill, font=font)
+
+    def paste(self, image: Image.Image, box: Tuple[int, int]):
+        name = image.info.get("source") or getattr(image, "filename", None) or None
+        x, y = self._point(box[0], box[1])
+        self.pdf.image_pil(image, x, y, image.size[0] * self.scale, image.size[1] * self.scale, name)
+
+
+class BuildCache:
+    # Rendered tiles and encoded pages on disk, named by the fingerprint of everything that went into them.
+    def __init__(self, directory: str = "cache"):
+        self.directory = directory
+        self.asset_stamps: Dict[str, str] = {}
+
+    def asset_stamp(self, path: str) -> str:
+        stamp = self.asset_stamps.get(path)
+        if stamp is None:
+            try:
+                stat = os.stat(path)
+                stamp = f"{stat.st_mtime_ns}:{stat.st_size}"
+            except OSError:
+                stamp = "missing"
+            self.asset_stamps[path] = stamp
+        return stamp
+
+    def tile_key(self, divider: "Divider") -> str:
+        stamps = [(path, self.asset_stamp(path)) for path in divider.assets()]
+        return hashlib.sha1(json.dumps([divider.fingerprint(), stamps]).encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def page_key(tile_keys: List[str], placements: List[Tuple[int, int, int]], global_properties: Mapping) -> str:
+        layout = {key: global_properties[key] for key in PAGE_LAYOUT_KEYS + OUTPUT_KEYS}
+        slots = [(tile_keys[index], x, y) for index, x, y in placements]
+        return hashlib.sha1(json.dumps([layout, slots], sort_keys=True).encode("utf-8")).hexdigest()
+
+    def _path(self, kind: str, key: str, extension: str) -> str:
+        return os.path.join(self.directory, kind, f"{key}.{extension}")
+
+    def tile_path(self, key: str) -> str:
+        return self._path("tiles", key, "png")
+
+    def get_tile(self, key: str) -> Optional[Image.Image]:
+        path = self.tile_path(key)
+        if not os.path.exists(path):
+            return None
+        tile = Image.open(path)
+        tile.load()
+        return tile
+
+    def put_tile(self, key: str, tile: Image.Image):
+        path = self.tile_path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tile.save(path)
+
+    def page_path(self, key: str) -> str:
+        return self._path("pages", key, "pickle")
+
+    def get_page(self, key: str) -> Optional[Dict]:
+        path = self.page_path(key)
+        if not os.path.exists(path):
+            return None
+        with open(path, "rb") as page_file:
+            return pickle.load(page_file)
+
+    def put_page(self, key: str, info: Dict):
+        path = self.page_path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as page_file:
+            pickle.dump(info, page_file)
+
+    def load_manifest(self, deck: str) -> Dict:
+        path = self._path("manifests", hashlib.sha1(os.path.abspath(deck).encode("utf-8")).hexdigest(), "json")
+        if not os.path.exists(path):
+            return {"tiles": [], "pages": []}
+        with open(path) as manifest_file:
+            return json.load(manifest_file)
+
+    def save_manifest(self, deck: str, manifest: Mapping):
+        path = self._path("manifests", hashlib.sha1(os.path.abspath(deck).encode("utf-8")).hexdigest(), "json")
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w") as manifest_file:
+            json.dump(manifest, manifest_file)
+
+    def prune(self):
+        # Tiles and pages are shared between decks, so only the files that no deck's last full build uses are removed.
+        tiles, pages = set(), set()
+        manifests = os.path.join(self.directory, "manifests")
+        for name in os.listdir(manifests) if os.path.isdir(manifests) else []:
+            try:
+                with open(os.path.join(manifests, name)) as manifest_file:
+                    manifest = json.load(manifest_file)
+            except (OSError, ValueError):
+                # Without every manifest there is no telling what is still in use.
+                return
+            tiles.update(manifest["tiles"])
+            pages.update(manifest["pages"])
+        for kind, keys in (("tiles", tiles), ("pages", pages)):
+            directory = os.path.join(self.directory, kind)
+            for name in os.listdir(directory) if os.path.isdir(directory) else []:
+                if os.path.splitext(name)[0] not in keys:
+                    os.remove(os.path.join(directory, name))
+
+
+class DeckUnpickler(pickle.Unpickler):
+    # A deck cached by `python divider.py` refers to __main__ and one cached by a script importing this module to
+    # divider. Both mean the classes defined here, whichever way this module was loaded now.
+    def find_class(self, module: str, name: str):
+        if module in ("__main__", "divider"):
+            if name not in globals():
+                # A class renamed since the deck was cached, Divider.load parses the YAML again.
+                raise AttributeError(f"module {module} has no attribute {name}")
+            return globals()[name]
+        return super().find_class(module, name)
+
+
+def _start_worker(level: str):
+    STATS.level = level
+
+
+def _render_divider(divider: "Divider") -> Tuple[Image.Image, Dict]:
+    image = divider.render()
+    return image, STATS.drain()
 
 
 class Divider:
-    def __init__(self, formatting: Mapping, properties: Mapping):
+    def __init__(self, formatting: Mapping, properties: Mapping, plan: Optional[List[LayoutNode]] = None):
         self.format = formatting
         self.properties = properties
+        self.plan = plan if plan is not None else compile_layout(formatting["properties"])
+        self._fingerprint = None
+
+    def fingerprint(self) -> str:
+        # Everything render() reads comes from the format and the card's properties, so identical pairs render
+        # identically and can share one image.
+        if self._fingerprint is None:
+            serialized = json.dumps([self.format, self.properties], sort_keys=True, default=repr)
+            self._fingerprint = hashlib.sha1(serialized.encode("utf-8")).hexdigest()
+        return self._fingerprint
+
+    def preview_name(self, index: int) -> str:
+        name = re.sub(r"[^a-z0-9]+", "_", str(self.properties.get("name", "")).lower()).strip("_")
+        return f"{index:04d}_{name}.png"
+
+    def assets(self) -> List[str]:
+        paths = set()
+        self._collect_assets(self.plan, paths)
+        return sorted(paths)
+
+    def _collect_assets(self, plan: List[LayoutNode], paths: set):
+        for node in walk_layout(plan):
+            paths.update(path for path, _ in node.fonts())
+            value = self.properties.get(node.property) if node.property is not None else None
+            if value is None:
+                continue
+            if isinstance(node, ListNode) and node.icons:
+                paths.update(ICONS.path(item) for item in value if ICONS.exists(item))
+            elif isinstance(node, ImageNode):
+                paths.add(ART.path(value))
+
+    def problems(self) -> List[str]:
+        # The errors render() would raise for this card, found without drawing anything.
+        found = []
+        for node in walk_layout(self.plan):
+            found.extend(f"Could not find font {path}" for path, _ in node.fonts() if not os.path.isfile(path))
+            value = self.properties.get(node.property) if node.property is not None else None
+            if value is None:
+                if node.required and isinstance(node, (TextNode, ListNode, ImageNode)):
+                    found.append(f"Missing required property: {node.property}")
+            elif isinstance(node, ImageNode):
+                if not os.path.isfile(ART.path(value)):
+                    found.append(f"Could not find image for {value} searched {ART.path(value)}")
+            elif isinstance(node, ListNode):
+                found.extend(f"Could not find icon for {item} searched {ICONS.path(item)}"
+                             for item in dict.fromkeys(value)
+                             if not node.text and not (node.icons and ICONS.exists(item)))
+            elif isinstance(node, ColorbarNode):
+                found.extend(f"Unknown color {color}" for color in dict.fromkeys(value) if color not in COLOR_VALUE)
+        return found
+
+    @staticmethod
+    def validate(dividers: List["Divider"]):
+        problems = [f"{divider.properties.get('name', f'Card {index}')}: {problem}"
+                    for index, divider in enumerate(dividers) for problem in divider.problems()]
+        if problems:
+            raise Exception(f"Found {len(problems)} problems before rendering:\n" + "\n".join(problems))
+
+    def prefetch_tasks(self) -> List[Tuple[Callable, tuple]]:
+        tasks = []
+        for node in walk_layout(self.plan):
+            tasks.extend((FONTS.get, font) for font in node.fonts())
+            value = self.properties.get(node.property) if node.property is not None else None
+            if value is None:
+                continue
+            if isinstance(node, ListNode) and node.icons:
+                tasks.extend((ICONS.get, (item, self.format["icon_height"])) for item in dict.fromkeys(value)
+                             if ICONS.exists(item))
+            elif isinstance(node, ImageNode):
+                tasks.append((ART.get, (value,)))
+        return tasks
 
     @staticmethod
-    def load(filename: str) -> Tuple[List["Divider"], Mapping]:
-        with open(filename) as source_file:
-            data = yaml.load(source_file)
+    def prefetch(dividers: List["Divider"], window: int = 16, threads: int = 2) -> Iterator["Divider"]:
+        # Yields the dividers in order while background threads read and decode the fonts, icons and art of the next
+        # window of them, so file reads and PNG decoding overlap with layout and drawing.
+        if window <= 0:
+            yield from dividers
+            return
+        with ThreadPoolExecutor(threads, thread_name_prefix="prefetch") as executor:
+            submitted = 0
+            for index, divider in enumerate(dividers):
+                while submitted < min(len(dividers), index + window):
+                    for load, arguments in dividers[submitted].prefetch_tasks():
+                        executor.submit(load, *arguments)
+                    submitted += 1
+                yield divider
+
+    @staticmethod
+    def parse(data: Mapping) -> Tuple[Mapping, Mapping, List[LayoutNode], List[Mapping]]:
         global_values = {
             "grid_lines": data["grid_lines"],
             "grid_width": data["grid_width"],
@@ -34,11 +1074,27 @@ class Divider:
             "offset_height": data["offset_height"],
             "offset_width": data["offset_width"],
             "margin_width": data["margin_width"],
-            "margin_height": data["margin_height"]
+            "margin_height": data["margin_height"],
+            "render_cache_size": data.get("render_cache_size", RENDER_CACHE_SIZE),
+            "workers": data.get("workers", 1),
+            "preload_fonts": data.get("preload_fonts", False),
+            "icon_atlas": data.get("icon_atlas", False),
+            "save_page_images": data.get("save_page_images", False),
+            "output_backend": data.get("output_backend", "raster"),
+            "incremental": data.get("incremental", False),
+            "instrumentation": data.get("instrumentation", "off"),
+            "output_mode": data.get("output_mode", "RGB"),
+            "output_dpi": data.get("output_dpi"),
+            "output_encoding": data.get("output_encoding", "png"),
+            "jpeg_quality": data.get("jpeg_quality", 85),
+            "compress_level": data.get("compress_level", 6),
+            "validate_assets": data.get("validate_assets", True),
+            "prefetch": data.get("prefetch", 16)
             }
         formatting = data["format"]
+        plan = compile_layout(formatting["properties"])
         populate_from_rarities = data["populate_from_rarities"]
-        results: List[Divider] = []
+        cards: List[Mapping] = []
         for card in data["cards"]:
             for rarity, count in populate_from_rarities["rarities"].items():
                 if rarity not in card:
@@ -46,226 +1102,350 @@ class Divider:
                 for source, property_name in populate_from_rarities["properties"].items():
                     if source not in card[rarity]:
                         continue
-                    if property_name not in card:
-                        card[property_name] = []
-                    card[property_name] += [card[rarity][source]]*count
-            results.append(Divider(formatting, card))
-        return results, global_values
+                    if not isinstance(card.get(property_name), Tally):
+                        card[property_name] = Tally.of(card.get(property_name) or [])
+                    card[property_name].add(card[rarity][source], count)
+            cards.append(card)
+        return global_values, formatting, plan, cards
 
     @staticmethod
-    def render_pages(dividers: List["Divider"], global_properties: Mapping):
-        pages: List[Image] = []
-        grid_lines = global_properties["grid_lines"]
-        grid_width = global_properties["grid_width"]
-        grid_spacing = global_properties["grid_spacing"]
-        double_sided = global_properties["double_sided"]
+    def deck_path(filename: str, directory: str = "cache") -> str:
+        # One file per deck, overwritten when the deck changes, so old versions do not pile up.
+        key = hashlib.sha1(os.path.abspath(filename).encode("utf-8")).hexdigest()
+        return os.path.join(directory, "decks", f"{key}.pickle")
+
+    @staticmethod
+    def load(filename: str, cache_directory: Optional[str] = "cache") -> Tuple[List["Divider"], Mapping]:
+        with open(filename, "rb") as source_file:
+            source = source_file.read()
+        # The YAML it was parsed from and the cache version come first, so a stale deck is never unpickled.
+        header = (hashlib.sha1(source).hexdigest(), DECK_CACHE_VERSION)
+        deck = None
+        path = Divider.deck_path(filename, cache_directory) if cache_directory is not None else None
+        if path is not None and os.path.exists(path):
+            try:
+                with open(path, "rb") as deck_file:
+                    if DeckUnpickler(deck_file).load() == header:
+                        deck = DeckUnpickler(deck_file).load()
+            except (OSError, EOFError, pickle.UnpicklingError, AttributeError, ImportError):
+                deck = None
+        if deck is None:
+            deck = Divider.parse(yaml.load(source, Loader=YAML_LOADER))
+            if path is not None:
+                # Written under a temporary name first so a concurrent run never reads half a file.
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                temporary_path = f"{path}.{os.getpid()}.tmp"
+                with open(temporary_path, "wb") as deck_file:
+                    pickle.dump(header, deck_file, pickle.HIGHEST_PROTOCOL)
+                    pickle.dump(deck, deck_file, pickle.HIGHEST_PROTOCOL)
+                os.replace(temporary_path, path)
+        global_values, formatting, plan, cards = deck
+        if global_values["preload_fonts"]:
+            FONTS.preload(plan)
+        if global_values["icon_atlas"]:
+            ICONS.load_atlas(formatting["icon_height"])
+        return [Divider(formatting, card, plan) for card in cards], global_values
+
+    @staticmethod
+    def render_all(dividers: List["Divider"], workers: int = 1, cache: RenderCache = RENDER_CACHE,
+                   prefetch: int = 0) -> Iterator[Image.Image]:
+        if workers == 0:
+            workers = os.cpu_count() or 1
+        if workers <= 1:
+            for divider in Divider.prefetch(dividers, prefetch):
+                yield cache.get(divider)
+            return
+        pending = OrderedDict()
+        for divider in dividers:
+            key = cache.key(divider)
+            if key not in cache.entries:
+                pending.setdefault(key, divider)
+        with multiprocessing.Pool(min(workers, max(len(pending), 1)), _start_worker, (STATS.level,)) as pool:
+            # imap hands results back in submission order, which is the order the dividers are first needed in.
+            results = zip(list(pending), pool.imap(_render_divider, list(pending.values())))
+            ready = {}
+            for divider in dividers:
+                key = cache.key(divider)
+                image = cache.lookup(key)
+                if image is None:
+                    while key in pending and key not in ready:
+                        rendered_key, (rendered_image, timings) = next(results)
+                        STATS.merge(timings)
+                        ready[rendered_key] = rendered_image
+                    pending.pop(key, None)
+                    image = ready.pop(key, None)
+                    if image is None:
+                        # Evicted from the cache since it was rendered for an earlier duplicate.
+                        image = divider.render()
+                    cache.store(key, image)
+                yield image
+
+    @staticmethod
+    def render_pages(dividers: List["Divider"], global_properties: Mapping, cache: RenderCache = RENDER_CACHE) -> \
+            List[Image.Image]:
+        return list(Divider.iter_pages(dividers, global_properties, cache))
+
+    @staticmethod
+    def iter_pages(dividers: List["Divider"], global_properties: Mapping, cache: RenderCache = RENDER_CACHE,
+                   pages: Optional[List[List[Tuple[int, int, int]]]] = None) -> Iterator[Image.Image]:
+        if pages is None:
+            pages = list(Divider.page_placements(len(dividers), global_properties))
+        # Dividers are rendered in the order the pages first need them and dropped after the last page using them.
+        order = list(dict.fromkeys(index for placements in pages for index, _, _ in placements))
+        last_use = {index: page_index for page_index, placements in enumerate(pages) for index, _, _ in placements}
+        images = Divider.render_all([dividers[index] for index in order], global_properties["workers"], cache,
+                                    global_properties["prefetch"])
+        rendered: Dict[int, Image.Image] = {}
+        next_position = 0
+        for page_index, placements in enumerate(pages):
+            for index, _, _ in placements:
+                while index not in rendered:
+                    rendered[order[next_position]] = next(images)
+                    next_position += 1
+            with STATS.timer("page", f"compose {page_index}"):
+                page = Divider.compose_page({index: rendered[index] for index, _, _ in placements}, placements,
+                                            global_properties)
+            for index, _, _ in placements:
+                if last_use[index] == page_index:
+                    rendered.pop(index, None)
+            yield page
+        images.close()
+
+    @staticmethod
+    def select(dividers: List["Divider"], global_properties: Mapping, names: Optional[List[str]] = None,
+               card_types: Optional[List[str]] = None, teams: Optional[List[str]] = None,
+               themes: Optional[List[str]] = None, pages: Optional[List[int]] = None) -> List[int]:
+        # Indices of the dividers matching every given filter, where a filter matches any of its values. Names, card
+        # types, teams and themes ignore case, pages are numbered like the "Generating page" output of a full build.
+        def wanted(values: Optional[List[str]]) -> Optional[set]:
+            return None if values is None else {str(value).lower() for value in values}
+
+        names, card_types, teams, themes = wanted(names), wanted(card_types), wanted(teams), wanted(themes)
+        on_pages = None
+        if pages is not None:
+            all_pages = list(Divider.page_placements(len(dividers), global_properties))
+            on_pages = {index for page in pages if 0 <= page < len(all_pages) for index, _, _ in all_pages[page]}
+        selected = []
+        for index, divider in enumerate(dividers):
+            properties = divider.properties
+            if names is not None and str(properties.get("name", "")).lower() not in names:
+                continue
+            if card_types is not None and str(properties.get("card_type", "")).lower() not in card_types:
+                continue
+            if teams is not None and not teams & {str(team).lower() for team in properties.get("teams") or []}:
+                continue
+            if themes is not None and not themes & {str(theme).lower() for theme in properties.get("themes") or []}:
+                continue
+            if on_pages is not None and index not in on_pages:
+                continue
+            selected.append(index)
+        return selected
+
+    @staticmethod
+    def selected_pages(dividers: List["Divider"], selected: List[int], global_properties: Mapping,
+                       keep_positions: bool = False) -> Tuple[List["Divider"], List[List[Tuple[int, int, int]]]]:
+        # Either the full deck's sheets holding a selected divider, with only those slots filled so a reprint lines up
+        # with the original cut, or the selected dividers packed onto as few sheets as possible.
+        if keep_positions:
+            chosen = set(selected)
+            pages = [[placement for placement in placements if placement[0] in chosen]
+                     for placements in Divider.page_placements(len(dividers), global_properties)]
+            return dividers, [placements for placements in pages if placements]
+        dividers = [dividers[index] for index in selected]
+        return dividers, list(Divider.page_placements(len(dividers), global_properties))
+
+    @staticmethod
+    def used_dividers(dividers: List["Divider"], pages: Optional[List[List[Tuple[int, int, int]]]]) -> \
+            List["Divider"]:
+        if pages is None:
+            return dividers
+        return [dividers[index] for index in dict.fromkeys(index for placements in pages for index, _, _ in placements)]
+
+    @staticmethod
+    def compose_page(images: Mapping[int, Image.Image], placements: List[Tuple[int, int, int]],
+                     global_properties: Mapping) -> Image.Image:
+        template, separate = PAGE_TEMPLATES.get([(x, y) + images[index].size for index, x, y in placements],
+                                                global_properties)
+        page = template.copy()
+        if separate:
+            for index, x, y in placements:
+                page.paste(images[index], (x, y))
+            return page
+        draw = ImageDraw.Draw(page)
+        for index, x, y in placements:
+            page.paste(images[index], (x, y))
+            if global_properties["grid_lines"]:
+                for line in Divider.cut_marks(x, y, global_properties):
+                    draw.line(line, fill="Black", width=global_properties["grid_width"])
+        return page
+
+    @staticmethod
+    def prepare_page(page: Image.Image, global_properties: Mapping) -> Image.Image:
+        # Pages are laid out at page_width pixels across the 8.5 inch sheet; output_dpi resamples them before they
+        # are converted to the output mode and handed to the PDF.
+        page = DividerPDF.convert_mode(page, "RGB")
+        dpi = global_properties["output_dpi"]
+        if dpi:
+            width = round(8.5 * dpi)
+            height = round(global_properties["page_height"] * width / global_properties["page_width"])
+            if (width, height) != page.size:
+                page = page.resize((width, height), Image.LANCZOS)
+        return DividerPDF.convert_mode(page, global_properties["output_mode"])
+
+    @staticmethod
+    def output_options(global_properties: Mapping) -> Dict:
+        return {"mode": global_properties["output_mode"], "encoding": global_properties["output_encoding"],
+                "quality": global_properties["jpeg_quality"], "compress_level": global_properties["compress_level"]}
+
+    @staticmethod
+    def page_placements(count: int, global_properties: Mapping) -> Iterator[List[Tuple[int, int, int]]]:
+        # Yields the (divider index, x, y) slots of every printed page, with each back side right after its front.
         width = global_properties["width_count"]
         height = global_properties["height_count"]
-        page_width = global_properties["page_width"]
-        page_height = global_properties["page_height"]
+        columns = [global_properties["offset_width"] + column *
+                   (global_properties["divider_width"] + global_properties["margin_width"]) for column in range(width)]
+        rows = [global_properties["offset_height"] + row *
+                (global_properties["divider_height"] + global_properties["margin_height"]) for row in range(height)]
+        # Slot offsets in fill order for the front and the mirrored back, shared by every page.
+        sides = [[(height * x_index + y_index, columns[x_index], rows[y_index])
+                  for x_index in range(width) for y_index in range(height)]]
+        if global_properties["double_sided"]:
+            sides.append([(height * x_index + y_index, columns[width - x_index - 1], rows[y_index])
+                          for x_index in range(width) for y_index in range(height)])
+        for page_number in range(int(math.ceil(count / width / height))):
+            first = width * height * page_number
+            for slots in sides:
+                yield [(first + slot, x, y) for slot, x, y in slots if first + slot < count]
+
+    @staticmethod
+    def cut_marks(x: int, y: int, global_properties: Mapping) -> List[Tuple[Tuple[int, int], Tuple[int, int]]]:
+        grid_spacing = global_properties["grid_spacing"]
         divider_width = global_properties["divider_width"]
         divider_height = global_properties["divider_height"]
-        offset_height = global_properties["offset_height"]
-        offset_width = global_properties["offset_width"]
         margin_width = global_properties["margin_width"]
         margin_height = global_properties["margin_height"]
-        for page_number in range(int(math.ceil(len(dividers) / width / height))):
-            page = Image.new("RGBA", (page_width, page_height), color="White")
-            draw = ImageDraw.Draw(page)
-            for x_index in range(width):
-                should_break = False
-                for y_index in range(height):
-                    index = width * height * page_number + height * x_index + y_index
-                    if index >= len(dividers):
-                        should_break = True
-                        break
-                    divider = dividers[index]
-                    x = offset_width + x_index * (divider_width + margin_width)
-                    y = offset_height + y_index * (divider_height + margin_height)
-                    div_image = divider.render()
-                    page.paste(div_image, (x, y))
-                    if grid_lines:
-                        draw.line(((x - margin_width + grid_spacing, y-1), (x - grid_spacing, y-1)),
-                                  fill="Black", width=grid_width)
-                        draw.line(((x-1, y - margin_height + grid_spacing), (x-1, y - grid_spacing)),
-                                  fill="Black", width=grid_width)
-                        draw.line(((x - margin_width + grid_spacing, y + divider_height),
-                                   (x - grid_spacing, y + divider_height)), fill="Black", width=grid_width)
-                        draw.line(((x - 1, y + divider_height + grid_spacing),
-                                   (x - 1, y + divider_height + margin_height - grid_spacing)),
-                                  fill="Black", width=grid_width)
-                        draw.line(((x + divider_width + grid_spacing, y - 1),
-                                   (x + divider_width + margin_width - grid_spacing, y - 1)),
-                                  fill="Black", width=grid_width)
-                        draw.line(((x + divider_width, y - margin_height + grid_spacing),
-                                   (x + divider_width, y - grid_spacing)), fill="Black", width=grid_width)
-                        draw.line(((x + divider_width, y + divider_height + grid_spacing),
-                                   (x + divider_width, y + divider_height + margin_height - grid_spacing)),
-                                  fill="Black", width=grid_width)
-                        draw.line(((x + divider_width + grid_spacing, y + divider_height),
-                                   (x + divider_width + margin_width - grid_spacing, y + divider_height)),
-                                  fill="Black", width=grid_width)
-                if should_break:
-                    break
-            pages.append(page)
-            if double_sided:
-                page = Image.new("RGBA", (page_width, page_height), color="White")
-                draw = ImageDraw.Draw(page)
-                for x_index in range(width):
-                    should_break = False
-                    for y_index in range(height):
-                        index = width * height * page_number + height * x_index + y_index
-                        if index >= len(dividers):
-                            should_break = True
-                            break
-                        divider = dividers[index]
-                        x = offset_width + (width - x_index - 1) * (divider_width + margin_width)
-                        y = offset_height + y_index * (divider_height + margin_height)
-                        div_image = divider.render()
-                        page.paste(div_image, (x, y))
-                        if grid_lines:
-                            draw.line(((x - margin_width + grid_spacing, y-1), (x - grid_spacing, y-1)),
-                                      fill="Black", width=grid_width)
-                            draw.line(((x-1, y - margin_height + grid_spacing), (x-1, y - grid_spacing)),
-                                      fill="Black", width=grid_width)
-                            draw.line(((x - margin_width + grid_spacing, y + divider_height),
-                                       (x - grid_spacing, y + divider_height)), fill="Black", width=grid_width)
-                            draw.line(((x - 1, y + divider_height + grid_spacing),
-                                       (x - 1, y + divider_height + margin_height - grid_spacing)),
-                                      fill="Black", width=grid_width)
-                            draw.line(((x + divider_width + grid_spacing, y - 1),
-                                       (x + divider_width + margin_width - grid_spacing, y - 1)),
-                                      fill="Black", width=grid_width)
-                            draw.line(((x + divider_width, y - margin_height + grid_spacing),
-                                       (x + divider_width, y - grid_spacing)), fill="Black", width=grid_width)
-                            draw.line(((x + divider_width, y + divider_height + grid_spacing),
-                                       (x + divider_width, y + divider_height + margin_height - grid_spacing)),
-                                      fill="Black", width=grid_width)
-                            draw.line(((x + divider_width + grid_spacing, y + divider_height),
-                                       (x + divider_width + margin_width - grid_spacing, y + divider_height)),
-                                      fill="Black", width=grid_width)
-                    if should_break:
-                        break
-                pages.append(page)
-        return pages
+        return [((x - margin_width + grid_spacing, y - 1), (x - grid_spacing, y - 1)),
+                ((x - 1, y - margin_height + grid_spacing), (x - 1, y - grid_spacing)),
+                ((x - margin_width + grid_spacing, y + divider_height), (x - grid_spacing, y + divider_height)),
+                ((x - 1, y + divider_height + grid_spacing),
+                 (x - 1, y + divider_height + margin_height - grid_spacing)),
+                ((x + divider_width + grid_spacing, y - 1), (x + divider_width + margin_width - grid_spacing, y - 1)),
+                ((x + divider_width, y - margin_height + grid_spacing), (x + divider_width, y - grid_spacing)),
+                ((x + divider_width, y + divider_height + grid_spacing),
+                 (x + divider_width, y + divider_height + margin_height - grid_spacing)),
+                ((x + divider_width + grid_spacing, y + divider_height),
+                 (x + divider_width + margin_width - grid_spacing, y + divider_height))]
 
     @staticmethod
-    def resolve_position(position: Tuple[Union[int, str], Union[int, str]],
-                         _: Tuple[Tuple[int, int], Tuple[int, int]], current_x: int, current_y: int) -> \
-            Tuple[int, int]:
-            result = []
-            if position[0] == "auto":
-                result.append(current_x)
-            else:
-                result.append(int(position[0]))
-            if position[1] == "auto":
-                result.append(current_y)
-            else:
-                result.append(int(position[1]))
-            return result[0], result[1]
+    def render_vector_page(pdf: DividerPDF, dividers: List["Divider"], placements: List[Tuple[int, int, int]],
+                           global_properties: Mapping):
+        scale = 8.5 / global_properties["page_width"]
+        page = VectorCanvas(pdf, 0, 0, scale)
+        for index, x, y in placements:
+            divider = dividers[index]
+            canvas = VectorCanvas(pdf, x, y, scale)
+            pdf.clip_rect(x * scale, y * scale, divider.format["width"] * scale, divider.format["height"] * scale)
+            divider.render_onto(canvas, canvas)
+            pdf.end_clip()
+            if global_properties["grid_lines"]:
+                for line in Divider.cut_marks(x, y, global_properties):
+                    page.line(line, fill="Black", width=global_properties["grid_width"])
 
-    def render_container(self, result: Image, draw: ImageDraw, draw_property: Mapping,
+    def render_container(self, result: Image, draw: ImageDraw, node: ContainerNode,
                          bounding_box: Tuple[Tuple[int, int], Tuple[int, int]], current_x: int, current_y: int,
                          backwards: bool) -> Tuple[int, int]:
-        new_bounding_box = [self.resolve_position(draw_property["position"], bounding_box, current_x, current_y),
-                            list(draw_property["size"])]
-        # CodeReview: Need to handle that when backwards is set new_bounding_box[0][0] needs to be the right
-        #   boundary not the left
-        print(draw_property)
-        print("ContainerPre", backwards, current_x, bounding_box, new_bounding_box)
-        if new_bounding_box[1][0] == "auto":
-            new_bounding_box[1][0] = bounding_box[1][0] - new_bounding_box[0][0] + bounding_box[0][0]
+        (box_x, box_y), (box_width, box_height) = bounding_box
+        x, y = node.resolve_position(current_x, current_y)
+        width, height = node.width, node.height
+        # CodeReview: Need to handle that when backwards is set x needs to be the right boundary not the left
+        STATS.trace("ContainerPre %s %s %s %s %s", node, backwards, current_x, bounding_box, ((x, y), (width, height)))
+        if width is None:
+            width = box_width - x + box_x
             if backwards:
-                new_bounding_box[1][0] = current_x - bounding_box[1][0] + bounding_box[0][0]
-                new_bounding_box[0][0] = bounding_box[1][0]
-        if new_bounding_box[1][1] == "auto":
-            new_bounding_box[1][1] = bounding_box[1][1] - new_bounding_box[0][1] + bounding_box[0][1]
-        new_backwards = draw_property["backwards"]
-        if new_backwards:
-            current_x = new_bounding_box[0][0] + new_bounding_box[1][0]
-        new_bounding_box = new_bounding_box[0], new_bounding_box[1]
-        print("Container", new_backwards, new_bounding_box, current_x)
-        for recursive_draw_property in draw_property["properties"]:
+                width = current_x - box_width + box_x
+                x = box_width
+        if height is None:
+            height = box_height - y + box_y
+        if node.backwards:
+            current_x = x + width
+        new_bounding_box = (x, y), (width, height)
+        STATS.trace("Container %s %s %s", node.backwards, new_bounding_box, current_x)
+        for child in node.children:
             prev_current_x = current_x
             prev_current_y = current_y
             cached_x = current_x
-            current_x, current_y = self.render_property(result, draw, recursive_draw_property, new_bounding_box,
-                                                        current_x, current_y, new_backwards)
+            current_x, current_y = self.render_node(child, result, draw, new_bounding_box, current_x, current_y,
+                                                    node.backwards)
             if prev_current_x != current_x:
-                current_x += draw_property["spacing"] if not new_backwards else -draw_property["spacing"]
-                print("XChanged", cached_x, current_x)
+                current_x += node.spacing if not node.backwards else -node.spacing
+                STATS.trace("XChanged %s %s", cached_x, current_x)
             if prev_current_y != current_y:
-                current_y += draw_property["spacing"]
+                current_y += node.spacing
         return current_x, current_y
 
-    def render_text(self, _: Image, draw: ImageDraw, draw_property: Mapping,
+    def render_text(self, _: Image, draw: ImageDraw, node: TextNode,
                     bounding_box: Tuple[Tuple[int, int], Tuple[int, int]], current_x: int, current_y: int,
                     backwards: bool) -> Tuple[int, int]:
-        font = ImageFont.truetype(draw_property["font"], draw_property["font_size"])
-        text = self.properties.get(draw_property["property"])
-        current_x, current_y = self.resolve_position(draw_property["position"], bounding_box, current_x, current_y)
+        font = FONTS.get(node.font, node.font_size)
+        text = self.properties.get(node.property)
+        current_x, current_y = node.resolve_position(current_x, current_y)
         if text is not None:
-            background = self.properties.get(draw_property["background_property"])
+            background = self.properties.get(node.background_property)
             if background is None:
-                background = draw_property["background_default"]
-            text_color = self.properties.get(draw_property["text_color_property"])
+                background = node.background_default
+            text_color = self.properties.get(node.text_color_property)
             if text_color is None:
-                text_color = draw_property["text_color_default"]
-            text_width, text_height = draw.textsize(text, font)
-            desired_width = draw_property["size"][0] if draw_property["size"][0] != "auto" else text_width
-            desired_height = draw_property["size"][1] if draw_property["size"][1] != "auto" else text_height
+                text_color = node.text_color_default
+            text_width, text_height = FONTS.textsize(text, node.font, node.font_size)
+            desired_width = node.width if node.width is not None else text_width
+            desired_height = node.height if node.height is not None else text_height
             if backwards:
                 current_x -= desired_width
             draw.rectangle(((current_x, current_y), (current_x + desired_width, current_y + desired_height)),
                            fill=background)
             # CodeReview: center between current_y and bottom of bounding box
-            x_coord = (current_x + (desired_width - text_width) // 2) if draw_property["centered_width"] else current_x
-            y_coord = (current_y + (desired_height - text_height) // 2) if draw_property["centered_height"] \
-                else current_y
+            x_coord = (current_x + (desired_width - text_width) // 2) if node.centered_width else current_x
+            y_coord = (current_y + (desired_height - text_height) // 2) if node.centered_height else current_y
             draw.text((x_coord, y_coord), text, fill=text_color, font=font)
             current_x += desired_width
-        elif draw_property["required"]:
-            raise Exception(f"Missing required property: {draw_property['property']} from card {self.properties}")
+        elif node.required:
+            raise Exception(f"Missing required property: {node.property} from card {self.properties}")
         return current_x, current_y
 
-    def render_list(self, result: Image, draw: ImageDraw, draw_property: Mapping,
+    def render_list(self, result: Image, draw: ImageDraw, node: ListNode,
                     bounding_box: Tuple[Tuple[int, int], Tuple[int, int]], current_x: int, current_y: int,
                     backwards: bool) -> Tuple[int, int]:
         theme_font = None
-        if "text" in draw_property["type"]:
-            theme_font = ImageFont.truetype(draw_property["font"], draw_property["font_size"])
-        items = self.properties.get(draw_property["property"])
-        current_x, current_y = self.resolve_position(draw_property["position"], bounding_box, current_x, current_y)
-        size_x, size_y = draw_property["size"]
-        if size_x == "auto":
+        if node.text:
+            theme_font = FONTS.get(node.font, node.font_size)
+        items = self.properties.get(node.property)
+        current_x, current_y = node.resolve_position(current_x, current_y)
+        size_x, size_y = node.width, node.height
+        if size_x is None:
             size_x = bounding_box[1][0] - current_x + bounding_box[0][0]
             if backwards:
                 size_x = current_x - bounding_box[0][0]
-        if size_y == "auto":
+        if size_y is None:
             size_y = bounding_box[1][1] - current_y + bounding_box[0][1]
-        print(current_x, size_x, backwards)
+        STATS.trace("List %s %s %s %s", node.property, current_x, size_x, backwards)
         if backwards:
             current_x = current_x - size_x
-        orientation = draw_property["orientation"]
+        orientation = node.orientation
         internal_current_y = current_y
         internal_current_x = current_x
         if items is not None:
             cached_current_x = current_x
             cached_current_y = current_y
-            spacing = draw_property["spacing"]
+            spacing = node.spacing
             x_border = current_x + size_x
             y_border = current_y + size_y
-            rows = draw_property["rows"]
-            columns = draw_property["columns"]
+            rows = node.rows
+            columns = node.columns
             first = True
             # CodeReview: Specify an order that all will conform to
             for item in items:
-                resource_name = f"resources/icons/{item}.png"
-                if "icon" in draw_property["type"] and os.path.isfile(resource_name):
-                    icon = Image.open(resource_name)
-                    icon_width, icon_height = icon.size
-                    icon = icon.resize((self.format["icon_height"] * icon_width // icon_height,
-                                        self.format["icon_height"]), Image.HAMMING)
+                if node.icons and ICONS.exists(item):
+                    icon = ICONS.get(item, self.format["icon_height"])
                     icon_width, icon_height = icon.size
                     x_coord = internal_current_x
                     y_coord = internal_current_y
@@ -273,13 +1453,13 @@ class Divider:
                         if not first:
                             x_coord += spacing
                         first = False
-                        if draw_property["centered_height"]:
+                        if node.centered_height:
                             y_coord += (size_y // (rows or 1) - icon_height) // 2
                     if orientation == "vertical":
                         if not first:
                             y_coord += spacing
                         first = False
-                        if draw_property["centered_width"]:
+                        if node.centered_width:
                             x_coord += (size_x // (columns or 1) - icon_width) // 2
                     if orientation == "horizontal" and x_coord + icon_width > x_border \
                             and rows is not None and internal_current_y < current_y + (rows - 1) * (size_y // rows):
@@ -297,35 +1477,35 @@ class Divider:
                         internal_current_x = x_coord + icon_width
                     elif orientation == "vertical":
                         internal_current_y = y_coord + icon_height
-                elif "text" in draw_property["type"]:
-                    text_width, text_height = draw.textsize(item, theme_font)
-                    if draw_property["wrap"] is not None:
-                        item = textwrap.fill(item, draw_property["wrap"])
-                        text_width, text_height = draw.multiline_textsize(item, theme_font)
+                elif node.text:
+                    text_width, text_height = FONTS.textsize(item, node.font, node.font_size)
+                    if node.wrap is not None:
+                        item = textwrap.fill(item, node.wrap)
+                        text_width, text_height = FONTS.textsize(item, node.font, node.font_size, True)
                     x_coord = internal_current_x
                     y_coord = internal_current_y
-                    text_color = self.properties.get(draw_property["text_color_property"]) or \
-                        draw_property["text_color_default"]
-                    if draw_property["bulleted"]:
+                    text_color = self.properties.get(node.text_color_property) or node.text_color_default
+                    if node.bulleted:
                         draw.ellipse((internal_current_x + spacing,
-                                      internal_current_y + (text_height - draw_property["font_size"]) // 2,
-                                      internal_current_x + spacing + draw_property["font_size"],
-                                      internal_current_y + (text_height + draw_property["spacing"]) // 2),
+                                      internal_current_y + (text_height - node.font_size) // 2,
+                                      internal_current_x + spacing + node.font_size,
+                                      internal_current_y + (text_height + node.spacing) // 2),
                                      fill=text_color)
-                        x_coord += spacing*2 + draw_property["font_size"]
+                        x_coord += spacing*2 + node.font_size
                     if orientation == "horizontal":
                         if not first:
                             x_coord += spacing
                         first = False
-                        if draw_property["centered_height"]:
+                        if node.centered_height:
                             y_coord += (size_y // (rows or 1) - text_height) // 2
                     if orientation == "vertical":
                         if not first:
                             y_coord += spacing
                         first = False
-                        if draw_property["centered_width"]:
+                        if node.centered_width:
                             x_coord += (size_x // (columns or 1) - text_width) // 2
-                    print(x_coord, text_width, x_border, cached_current_x, internal_current_y)
+                    STATS.trace("ListText %s %s %s %s %s", x_coord, text_width, x_border, cached_current_x,
+                                internal_current_y)
                     if orientation == "horizontal" and x_coord + text_width > x_border \
                             and rows is not None and internal_current_y < current_y + (rows - 1) * (size_y // rows):
                         internal_current_y += size_y // rows
@@ -337,7 +1517,7 @@ class Divider:
                             internal_current_x < current_x + (columns - 1) * (size_y // columns):
                         internal_current_x += size_x // rows
                         internal_current_y = cached_current_y
-                    if draw_property["wrap"] is None:
+                    if node.wrap is None:
                         draw.text((x_coord, y_coord), item, fill=text_color, font=theme_font)
                     else:
                         draw.multiline_text((x_coord, y_coord), item, fill=text_color, font=theme_font)
@@ -347,122 +1527,415 @@ class Divider:
                     elif orientation == "vertical":
                         internal_current_y = y_coord + text_height
                 else:
-                    raise Exception(f"Could not find handler for {item} for {draw_property['type']}")
+                    raise Exception(f"Could not find handler for {item} for {node.type}")
             if not backwards:
                 current_x += size_x
             if orientation == "vertical":
                 current_y += size_y
         else:
-            if draw_property["required"]:
-                raise Exception(f"Missing required property: {draw_property['property']} from card {self.properties}")
+            if node.required:
+                raise Exception(f"Missing required property: {node.property} from card {self.properties}")
         return current_x, current_y
 
-    def render_colorbar(self, _: Image, draw: ImageDraw, draw_property: Mapping,
+    def render_colorbar(self, _: Image, draw: ImageDraw, node: ColorbarNode,
                         _2: Tuple[Tuple[int, int], Tuple[int, int]], current_x: int, current_y: int,
                         backwards: bool) -> Tuple[int, int]:
-        colors = self.properties.get(draw_property["property"])
+        colors = self.properties.get(node.property)
         if colors is not None:
-            color_distribution = Counter(colors)
-            total_color = sum(amount for amount in color_distribution.values())
+            color_distribution = colors if isinstance(colors, Tally) else Tally.of(colors)
+            total_color = len(color_distribution)
             if total_color > 0:
-                color_value = {"Y": 0, "U": 1, "B": 2, "R": 3, "G": 4, "YU": 5, "UB": 6, "BR": 7, "RG": 8, "GY": 9,
-                               "YB": 10, "UR": 11, "BG": 12, "RY": 13, "GU": 14, "E": 15, "W": 16
-                               }
-                color_to_color = {"Y": "#dea319", "U": "#01a1d5", "B": "#a6a8ab", "R": "#b32f40", "G": "#46b650",
-                                  "E": "#7e8184", "W": "White"
-                                  }
-                colors = sorted(color_distribution.keys(), key=lambda c: color_value[c])
                 # CodeReview: Support auto sizing
                 if backwards:
-                    current_x -= draw_property["size"][0]
-                print(self.properties["name"], current_x, draw_property["size"])
-                for color in colors:
-                    bar_width = color_distribution[color] * draw_property["size"][0] // total_color
+                    current_x -= node.width
+                STATS.trace("Colorbar %s %s %s", self.properties.get("name"), current_x, (node.width, node.height))
+                for color, amount in sorted(color_distribution.items(), key=lambda item: COLOR_VALUE[item[0]]):
+                    bar_width = amount * node.width // total_color
                     if len(color) == 1:
-                        draw.rectangle(((current_x, current_y),
-                                        (current_x + bar_width, current_y + draw_property["size"][1])),
-                                       fill=color_to_color[color])
-                        print(current_x, bar_width, color, draw_property["size"][1])
+                        draw.rectangle(((current_x, current_y), (current_x + bar_width, current_y + node.height)),
+                                       fill=COLOR_TO_COLOR[color])
+                        STATS.trace("Bar %s %s %s %s", current_x, bar_width, color, node.height)
                     elif len(color) == 2:
                         color1, color2 = color
                         draw.rectangle(((current_x, current_y),
-                                        (current_x + bar_width, current_y + draw_property["size"][1] // 2)),
-                                       fill=color_to_color[color1])
-                        draw.rectangle(((current_x, current_y + draw_property["size"][1] // 2),
-                                        (current_x + bar_width, current_y + draw_property["size"][1])),
-                                       fill=color_to_color[color2])
-                        print(current_x, bar_width, color1, color2, draw_property["size"][1])
+                                        (current_x + bar_width, current_y + node.height // 2)),
+                                       fill=COLOR_TO_COLOR[color1])
+                        draw.rectangle(((current_x, current_y + node.height // 2),
+                                        (current_x + bar_width, current_y + node.height)),
+                                       fill=COLOR_TO_COLOR[color2])
+                        STATS.trace("Bar %s %s %s %s %s", current_x, bar_width, color1, color2, node.height)
                     current_x += bar_width
             if backwards:
-                current_x -= draw_property["size"][0]
+                current_x -= node.width
         return current_x, current_y
 
-    def render_image(self, result: Image, _: ImageDraw, draw_property: Mapping,
+    def render_image(self, result: Image, _: ImageDraw, node: ImageNode,
                      bounding_box: Tuple[Tuple[int, int], Tuple[int, int]], current_x: int, current_y: int,
                      backwards: bool) -> Tuple[int, int]:
-        current_x, current_y = self.resolve_position(draw_property["position"], bounding_box, current_x, current_y)
-        image_name = self.properties.get(draw_property["property"])
+        current_x, current_y = node.resolve_position(current_x, current_y)
+        image_name = self.properties.get(node.property)
         if image_name is not None:
-            path = f"resources/images/{image_name}.png"
-            if os.path.exists(path):
-                image = Image.open(path)
-                result.paste(image, (current_x - draw_property["size"][0] if backwards else 0, current_y))
+            path = ART.path(image_name)
+            image = ART.get(image_name)
+            if image is not None:
+                result.paste(image, (current_x - node.width if backwards else 0, current_y))
                 current_x += image.size[0]
             else:
                 raise Exception(f"Could not find image for {image_name} searched {path}")
-        elif draw_property["required"]:
-            raise Exception(f"Missing required property: {draw_property['property']} from card {self.properties}")
+        elif node.required:
+            raise Exception(f"Missing required property: {node.property} from card {self.properties}")
         if backwards:
-            current_x -= draw_property["size"][0]
+            current_x -= node.width
         else:
-            current_x += draw_property["size"][0]
+            current_x += node.width
         return current_x, current_y
 
-    def render_property(self, result: Image, draw: ImageDraw, draw_property: Mapping,
-                        bounding_box: Tuple[Tuple[int, int], Tuple[int, int]], current_x: int, current_y: int,
-                        backwards: bool) -> Tuple[int, int]:
-        if draw_property["type"] == "container":
-            return self.render_container(result, draw, draw_property, bounding_box, current_x, current_y, backwards)
-        elif draw_property["type"] == "text":
-            return self.render_text(result, draw, draw_property, bounding_box, current_x, current_y, backwards)
-        elif draw_property["type"].startswith("list["):
-            return self.render_list(result, draw, draw_property, bounding_box, current_x, current_y, backwards)
-        elif draw_property["type"] == "colorbar":
-            return self.render_colorbar(result, draw, draw_property, bounding_box, current_x, current_y, backwards)
-        elif draw_property["type"] == "image":
-            return self.render_image(result, draw, draw_property, bounding_box, current_x, current_y, backwards)
-        else:
-            raise Exception(f"Unsupported type {draw_property['type']} in property {draw_property}")
-
     def render(self) -> Image:
         result = Image.new("RGBA", (self.format["width"], self.format["height"]), "White")
-        draw = ImageDraw.Draw(result)
-        for draw_property in self.format["properties"]:
-            self.render_property(result, draw, draw_property, ((0, 0), (self.format["width"], self.format["height"])),
-                                 0, 0, False)
+        self.render_onto(result, ImageDraw.Draw(result))
         return result
 
+    def render_onto(self, result: Image, draw: ImageDraw):
+        start = time.perf_counter()
+        for node in self.plan:
+            self.render_node(node, result, draw, ((0, 0), (self.format["width"], self.format["height"])), 0, 0, False)
+        if STATS.enabled:
+            STATS.record("card", str(self.properties.get("name")), time.perf_counter() - start)
 
-def main(input_file: str):
-    dividers, global_properties = Divider.load(input_file)
-    pages = Divider.render_pages(dividers, global_properties)
-    pdf = FPDF('P', "in", "Letter")
-    flipped_pdf = FPDF('P', "in", "Letter")
-    if not os.path.exists("output"):
-        os.makedirs("output")
-    for i, page in enumerate(pages):
+    def render_node(self, node: LayoutNode, result: Image, draw: ImageDraw,
+                    bounding_box: Tuple[Tuple[int, int], Tuple[int, int]], current_x: int, current_y: int,
+                    backwards: bool) -> Tuple[int, int]:
+        if not STATS.enabled:
+            return node.render(self, result, draw, bounding_box, current_x, current_y, backwards)
+        # Container timings include their children.
+        start = time.perf_counter()
+        position = node.render(self, result, draw, bounding_box, current_x, current_y, backwards)
+        STATS.record("node", node.type, time.perf_counter() - start)
+        return position
+
+
+def build_incremental(input_file: str, dividers: List[Divider], global_properties: Mapping,
+                      document: Callable[[int], DividerPDF], build_cache: BuildCache,
+                      pages: Optional[List[List[Tuple[int, int, int]]]] = None, output_directory: str = "output"):
+    # With an explicit page list only part of the deck is built, which says nothing about the pages left out, so the
+    # manifest of the last full build is left alone.
+    partial = pages is not None
+    manifest = build_cache.load_manifest(input_file)
+    tile_keys = [build_cache.tile_key(divider) for divider in dividers]
+    page_placements = pages if partial else list(Divider.page_placements(len(dividers), global_properties))
+    page_keys = [build_cache.page_key(tile_keys, placements, global_properties) for placements in page_placements]
+    stale_pages = [i for i, page_key in enumerate(page_keys) if not os.path.exists(build_cache.page_path(page_key))]
+    needed = sorted({index for i in stale_pages for index, _, _ in page_placements[i]})
+    missing = [index for index in needed if not os.path.exists(build_cache.tile_path(tile_keys[index]))]
+    rendered = Divider.render_all([dividers[index] for index in missing], global_properties["workers"],
+                                  prefetch=global_properties["prefetch"])
+    for index, tile in zip(missing, rendered):
+        build_cache.put_tile(tile_keys[index], tile)
+    changed_cards = len(set(tile_keys) - set(manifest["tiles"]))
+    print(f"Incremental build: {changed_cards} changed cards, {len(missing)} dividers rendered, "
+          f"{len(stale_pages)} of {len(page_keys)} pages recomposited")
+    for i, placements in enumerate(page_placements):
         print(f"Generating page {i}")
-        page.save(f"output/page{i}.png")
-        if global_properties["double_sided"] and global_properties["separate_docs"] and i % 2 == 1:
-            flipped_pdf.add_page()
-            flipped_pdf.image(f"output/page{i}.png", 0, 0, 8.5, 11)
-        else:
-            pdf.add_page()
-            pdf.image(f"output/page{i}.png", 0, 0, 8.5, 11)
-    pdf.output("output/dividers.pdf")
-    if global_properties["separate_docs"] and global_properties["double_sided"]:
-        flipped_pdf.output("output/dividers_flipped.pdf")
+        info = build_cache.get_page(page_keys[i])
+        if info is None:
+            tiles = {index: build_cache.get_tile(tile_keys[index]) for index, _, _ in placements}
+            with STATS.timer("page", f"compose {i}"):
+                page = Divider.compose_page(tiles, placements, global_properties)
+            with STATS.timer("page", f"pdf {i}"):
+                page = Divider.prepare_page(page, global_properties)
+                if global_properties["save_page_images"]:
+                    page.save(os.path.join(output_directory, f"page{i}.png"))
+                info = DividerPDF.encode_image(page, **Divider.output_options(global_properties))
+            build_cache.put_page(page_keys[i], info)
+        document(i).add_page()
+        document(i).image_info(info, 0, 0, 8.5, 11)
+    if partial:
+        return
+    build_cache.save_manifest(input_file, {"tiles": tile_keys, "pages": page_keys,
+                                           "assets": build_cache.asset_stamps})
+    build_cache.prune()
+
+
+def main(input_file: str, overrides: Optional[Mapping] = None, selection: Optional[Mapping] = None,
+         output_directory: str = "output") -> Dict:
+    start = time.perf_counter()
+    hits, misses = RENDER_CACHE.hits, RENDER_CACHE.misses
+    dividers, global_properties = Divider.load(input_file)
+    global_properties.update({key: value for key, value in (overrides or {}).items() if value is not None})
+    STATS.level = global_properties["instrumentation"]
+    if STATS.enabled:
+        STATS.record("stage", "load", time.perf_counter() - start)
+    RENDER_CACHE.max_size = global_properties["render_cache_size"]
+    pages = None
+    selection = {key: value for key, value in (selection or {}).items() if value is not None}
+    keep_positions = selection.pop("keep_positions", False)
+    if selection:
+        selected = Divider.select(dividers, global_properties, **selection)
+        if not selected:
+            raise Exception(f"No cards in {input_file} match {selection}")
+        dividers, pages = Divider.selected_pages(dividers, selected, global_properties, keep_positions)
+        print(f"Selected {len(selected)} cards on {len(pages)} pages")
+    if global_properties["validate_assets"]:
+        with STATS.timer("stage", "validate"):
+            Divider.validate(Divider.used_dividers(dividers, pages))
+    pdf = DividerPDF('P', "in", "Letter")
+    flipped_pdf = DividerPDF('P', "in", "Letter")
+    pdf.output_options = flipped_pdf.output_options = Divider.output_options(global_properties)
+    if not os.path.exists(output_directory):
+        os.makedirs(output_directory)
+
+    def document(page_index: int) -> DividerPDF:
+        if global_properties["double_sided"] and global_properties["separate_docs"] and page_index % 2 == 1:
+            return flipped_pdf
+        return pdf
+
+    if global_properties["incremental"] and global_properties["output_backend"] == "raster":
+        build_incremental(input_file, dividers, global_properties, document, BuildCache(), pages, output_directory)
+    elif global_properties["output_backend"] == "vector":
+        for i, placements in enumerate(pages or Divider.page_placements(len(dividers), global_properties)):
+            print(f"Generating page {i}")
+            with STATS.timer("page", f"vector {i}"):
+                document(i).add_page()
+                Divider.render_vector_page(document(i), dividers, placements, global_properties)
+    else:
+        for i, page in enumerate(Divider.iter_pages(dividers, global_properties, pages=pages)):
+            print(f"Generating page {i}")
+            with STATS.timer("page", f"pdf {i}"):
+                page = Divider.prepare_page(page, global_properties)
+                if global_properties["save_page_images"]:
+                    page.save(os.path.join(output_directory, f"page{i}.png"))
+                document(i).add_page()
+                document(i).image_pil(page, 0, 0, 8.5, 11)
+    with STATS.timer("stage", "write"):
+        pdf.output(os.path.join(output_directory, "dividers.pdf"))
+        if global_properties["separate_docs"] and global_properties["double_sided"]:
+            flipped_pdf.output(os.path.join(output_directory, "dividers_flipped.pdf"))
+    if global_properties["icon_atlas"] and dividers:
+        ICONS.save_atlas(dividers[0].format["icon_height"])
+    print(RENDER_CACHE)
+    if STATS.enabled:
+        print(STATS.report())
+    used = Divider.used_dividers(dividers, pages)
+    return {"deck": input_file, "cards": len(used), "distinct": {divider.fingerprint() for divider in used},
+            "rendered": RENDER_CACHE.misses - misses, "reused": RENDER_CACHE.hits - hits,
+            "seconds": time.perf_counter() - start}
+
+
+def expand_decks(patterns: List[str]) -> List[str]:
+    decks: List[str] = []
+    for pattern in patterns:
+        matches = sorted(glob.glob(pattern)) if any(character in pattern for character in "*?[") else [pattern]
+        if not matches:
+            raise Exception(f"No decks match {pattern}")
+        decks.extend(deck for deck in matches if deck not in decks)
+    return decks
+
+
+def batch(patterns: List[str], overrides: Optional[Mapping] = None, selection: Optional[Mapping] = None,
+          cache_megabytes: int = 1024):
+    decks = expand_decks(patterns)
+    names = [os.path.splitext(os.path.basename(deck))[0] for deck in decks]
+    if len(set(names)) < len(names):
+        names = [os.path.splitext(os.path.relpath(deck))[0].replace(os.sep, "_").lstrip("._") for deck in decks]
+    # One render cache for every deck, bounded by memory instead of count, so a card that several decks share with
+    # the same format is only drawn once.
+    RENDER_CACHE.max_bytes = cache_megabytes * 1024 * 1024
+    overrides = dict(overrides or {}, render_cache_size=1 << 20)
+    start = time.perf_counter()
+    results = []
+    for deck, name in zip(decks, names):
+        output_directory = os.path.join("output", name)
+        print(f"Building {deck} into {output_directory}")
+        results.append(main(deck, overrides, selection, output_directory))
+    distinct = set().union(*(result["distinct"] for result in results))
+    lines = [f"Built {len(decks)} decks in {time.perf_counter() - start:.2f}s",
+             f"  {'deck':<40} {'cards':>6} {'drawn':>6} {'reused':>6} {'time':>8}"]
+    for result in results:
+        lines.append(f"  {result['deck']:<40} {result['cards']:>6} {result['rendered']:>6} {result['reused']:>6} "
+                     f"{result['seconds']:>7.2f}s")
+    lines.append(f"  {sum(result['cards'] for result in results)} cards, {len(distinct)} distinct, "
+                 f"{sum(result['rendered'] for result in results)} drawn, "
+                 f"{RENDER_CACHE.size / (1024 * 1024):.0f}MB of dividers cached")
+    print("\n".join(lines))
+
+
+def scan_files(directory: str) -> Dict[str, Tuple[int, int]]:
+    stamps = {}
+    for root, _, files in os.walk(directory):
+        for name in files:
+            path = os.path.normpath(os.path.join(root, name))
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            stamps[path] = (stat.st_mtime_ns, stat.st_size)
+    return stamps
+
+
+def _read_commands(commands: "queue.Queue[str]"):
+    for line in sys.stdin:
+        commands.put(line.strip().lower())
+
+
+def watch(input_file: str, overrides: Optional[Mapping] = None, interval: float = 0.5,
+          preview_directory: str = os.path.join("output", "preview"), resources: str = "resources"):
+    # Polls the deck and the resources tree and redraws the previews of the dividers a change can affect: a card whose
+    # fingerprint changed, which covers edits to the card itself and to the format, or one that uses a changed file.
+    # The PDFs are only written when asked for.
+    overrides = {key: value for key, value in (overrides or {}).items() if value is not None}
+    if not os.path.exists(preview_directory):
+        os.makedirs(preview_directory)
+    commands: "queue.Queue[str]" = queue.Queue()
+    threading.Thread(target=_read_commands, args=(commands,), daemon=True).start()
+    print(f"Watching {input_file} and {resources}/, previews go to {preview_directory}/. "
+          f"Type build to write the PDFs or quit to stop.")
+    deck_stamp = None
+    resource_stamps = scan_files(resources)
+    dividers: List[Divider] = []
+    global_properties: Mapping = {}
+    # Index to the preview file, fingerprint and assets each preview was last drawn from.
+    previews: Dict[int, Tuple[Optional[str], str, set]] = {}
+    # The render cache is keyed on fingerprints, which do not cover the contents of fonts, icons and art.
+    stale_renders = False
+    try:
+        while True:
+            start = time.perf_counter()
+            try:
+                stat = os.stat(input_file)
+                stamp = (stat.st_mtime_ns, stat.st_size)
+            except OSError:
+                stamp = deck_stamp
+            if stamp != deck_stamp:
+                deck_stamp = stamp
+                try:
+                    # Every save is a new deck, so none of them are worth keeping in cache/decks.
+                    dividers, global_properties = Divider.load(input_file, None)
+                    global_properties.update(overrides)
+                except Exception as e:
+                    print(f"Could not load {input_file}: {e}")
+            scanned = scan_files(resources)
+            changed = {path for path in scanned.keys() | resource_stamps.keys()
+                       if scanned.get(path) != resource_stamps.get(path)}
+            resource_stamps = scanned
+            if changed:
+                ICONS.refresh()
+                FONTS.forget(changed)
+                stale_renders = True
+            updated = []
+            for index, divider in enumerate(dividers):
+                previous = previews.get(index)
+                if previous is None or previous[1] != divider.fingerprint():
+                    updated.append(index)
+                elif changed and (previous[2] | set(map(os.path.normpath, divider.assets()))) & changed:
+                    updated.append(index)
+            for index in [index for index in previews if index >= len(dividers)]:
+                filename = previews.pop(index)[0]
+                if filename is not None and os.path.exists(os.path.join(preview_directory, filename)):
+                    os.remove(os.path.join(preview_directory, filename))
+            drawn = 0
+            targets = [dividers[index] for index in updated]
+            for index, divider in zip(updated, Divider.prefetch(targets, global_properties.get("prefetch", 0))):
+                previous = previews.get(index)
+                filename = divider.preview_name(index)
+                if previous is not None and previous[0] not in (None, filename) and \
+                        os.path.exists(os.path.join(preview_directory, previous[0])):
+                    os.remove(os.path.join(preview_directory, previous[0]))
+                problems = divider.problems() if global_properties["validate_assets"] else []
+                try:
+                    if problems:
+                        raise Exception(", ".join(problems))
+                    image = divider.render()
+                except Exception as e:
+                    # The outdated preview is removed rather than left looking current, it is drawn again once the
+                    # deck or one of the files the card refers to changes.
+                    print(f"Could not draw {divider.properties.get('name', f'card {index}')}: {e}")
+                    if os.path.exists(os.path.join(preview_directory, filename)):
+                        os.remove(os.path.join(preview_directory, filename))
+                    filename = None
+                else:
+                    # Written beside the preview and moved over it, so an image viewer never reads half a file.
+                    path = os.path.join(preview_directory, filename)
+                    image.save(f"{path}.tmp", "PNG", compress_level=1)
+                    os.replace(f"{path}.tmp", path)
+                    drawn += 1
+                previews[index] = (filename, divider.fingerprint(), set(map(os.path.normpath, divider.assets())))
+            if updated:
+                cause = f" after changes to {', '.join(sorted(changed))}" if changed and len(changed) <= 3 else ""
+                print(f"Updated {drawn} of {len(dividers)} previews in {time.perf_counter() - start:.2f}s{cause}")
+            try:
+                command = commands.get(timeout=interval)
+            except queue.Empty:
+                continue
+            if command in ("quit", "exit", "q"):
+                return
+            if command in ("build", "b"):
+                if stale_renders:
+                    RENDER_CACHE.clear()
+                    stale_renders = False
+                try:
+                    main(input_file, overrides)
+                except Exception as e:
+                    print(f"Build failed: {e}")
+            elif command:
+                print(f"Unknown command {command}, type build or quit")
+    except KeyboardInterrupt:
+        pass
 
 
 if __name__ == "__main__":
-    main("cards.yaml")
+    parser = argparse.ArgumentParser(description="Generate printable dividers for Marvel Legendary.")
+    parser.add_argument("input_files", nargs="*", default=["cards.yaml"], metavar="DECK",
+                        help="deck files or globs, several are built in one batch into output/<deck>/")
+    parser.add_argument("--batch-cache-mb", type=int, default=1024,
+                        help="memory for dividers shared between the decks of a batch, in megabytes")
+    parser.add_argument("--workers", type=int, help="processes to render dividers with, 0 for one per core")
+    parser.add_argument("--backend", choices=["raster", "vector"], help="draw pages as images or as PDF shapes")
+    parser.add_argument("--incremental", action="store_true", default=None,
+                        help="only re-render dividers and pages that changed since the last incremental build")
+    parser.add_argument("--mode", choices=OUTPUT_MODES, help="pixel mode of the pages: RGB, P for a palette or L")
+    parser.add_argument("--dpi", type=int, help="resample pages to this resolution before embedding them")
+    parser.add_argument("--encoding", choices=OUTPUT_ENCODINGS, help="how page images are compressed in the PDF")
+    parser.add_argument("--quality", type=int, help="JPEG quality from 1 to 95 for --encoding jpeg")
+    parser.add_argument("--name", action="append", dest="names", metavar="NAME",
+                        help="only build this card, can be repeated")
+    parser.add_argument("--card-type", action="append", dest="card_types", metavar="TYPE",
+                        help="only build cards of this card_type, can be repeated")
+    parser.add_argument("--team", action="append", dest="teams", metavar="TEAM",
+                        help="only build cards of this team, can be repeated")
+    parser.add_argument("--theme", action="append", dest="themes", metavar="THEME",
+                        help="only build cards with this theme, can be repeated")
+    parser.add_argument("--page", action="append", dest="pages", type=int, metavar="N",
+                        help="only build the cards on page N of the full build, counting from 0, can be repeated")
+    parser.add_argument("--keep-positions", action="store_true",
+                        help="print selected cards in their original slots instead of packing them together")
+    parser.add_argument("--watch", action="store_true",
+                        help="redraw previews of the dividers affected by each change to the deck or resources/")
+    parser.add_argument("--stats", choices=Instrumentation.LEVELS, help="collect render timings, trace prints each one")
+    parser.add_argument("--profile", action="store_true", help="run under cProfile and print the top functions")
+    parser.add_argument("--profile-out", metavar="FILE", help="run under cProfile and also save the stats to FILE")
+    args = parser.parse_args()
+    run_options = {"workers": args.workers, "output_backend": args.backend, "incremental": args.incremental,
+                   "instrumentation": args.stats, "output_mode": args.mode, "output_dpi": args.dpi,
+                   "output_encoding": args.encoding, "jpeg_quality": args.quality}
+    selection = {"names": args.names, "card_types": args.card_types, "teams": args.teams, "themes": args.themes,
+                 "pages": args.pages, "keep_positions": args.keep_positions}
+    input_files = expand_decks(args.input_files)
+    if args.profile_out is not None and os.path.normcase(os.path.realpath(args.profile_out)) in \
+            {os.path.normcase(os.path.realpath(deck)) for deck in input_files}:
+        parser.error(f"--profile-out {args.profile_out} would overwrite an input deck")
+    if args.watch and len(input_files) > 1:
+        parser.error("--watch takes a single deck")
+    if args.watch:
+        run, run_arguments = watch, (input_files[0], run_options)
+    elif len(input_files) == 1:
+        run, run_arguments = main, (input_files[0], run_options, selection)
+    else:
+        run, run_arguments = batch, (input_files, run_options, selection, args.batch_cache_mb)
+    if not args.profile and args.profile_out is None:
+        run(*run_arguments)
+    else:
+        profiler = cProfile.Profile()
+        profiler.runcall(run, *run_arguments)
+        pstats.Stats(profiler).sort_stats("cumulative").print_stats(25)
+        if args.profile_out:
+            profiler.dump_stats(args.profile_out)
@@ -1,9 +1,12 @@
+import argparse
 import os
+import tempfile
 
 import pdf2image
 import yaml
 
-from typing import List
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Mapping, Tuple
 
 DIVIDER_WIDTH = 728
 DIVIDER_HEIGHT = 592
@@ -12,32 +15,69 @@ DIVIDER_MARGIN_WIDTH = 80
 DIVIDER_OFFSET_HEIGHT = 100
 DIVIDER_OFFSET_WIDTH = 90
 LABEL_HEIGHT = 72
+DPI = 200
 
 
-def extract_images(filename: str, names: List[str], width: int = 2, height: int = 3):
+def is_up_to_date(filename: str, name: str) -> bool:
+    output = f"output/{name}.png"
+    return os.path.exists(output) and os.path.getmtime(output) >= os.path.getmtime(filename)
+
+
+def plan_pages(sources: List[Mapping], width: int = 2, height: int = 3, force: bool = False) -> \
+        Dict[Tuple[str, int], List[Tuple[int, str]]]:
+    # Maps (pdf, page number) to the (slot, name) pairs to crop from it. A name listed more than once is only taken
+    # from its last occurrence, which is the one that used to win by being written last.
+    last_source: Dict[str, Tuple[str, int]] = {}
+    for source_file in sources:
+        for index, name in enumerate(source_file["names"]):
+            last_source[name] = (source_file["path"], index)
+    pages: Dict[Tuple[str, int], List[Tuple[int, str]]] = {}
+    for name, (filename, index) in last_source.items():
+        if not force and is_up_to_date(filename, name):
+            continue
+        page_number, slot = divmod(index, width * height)
+        pages.setdefault((filename, page_number + 1), []).append((slot, name))
+    return pages
+
+
+def extract_page(filename: str, page_number: int, slots: List[Tuple[int, str]], width: int = 2):
+    # Only the one page is rasterized, into a scratch folder that is removed as soon as it has been cropped.
+    with tempfile.TemporaryDirectory(dir="temp") as output_folder:
+        page, = pdf2image.convert_from_path(filename, dpi=DPI, output_folder=output_folder,
+                                            first_page=page_number, last_page=page_number)
+        for slot, name in sorted(slots):
+            y_index, x_index = divmod(slot, width)
+            x = DIVIDER_OFFSET_WIDTH + x_index * (DIVIDER_WIDTH + DIVIDER_MARGIN_WIDTH)
+            y = DIVIDER_OFFSET_HEIGHT + y_index * (DIVIDER_HEIGHT + DIVIDER_MARGIN_HEIGHT)
+            result = page.crop((x, y + LABEL_HEIGHT, x + DIVIDER_WIDTH, y + DIVIDER_HEIGHT))
+            print(name)
+            result.save(f"output/{name}.png")
+        page.close()
+
+
+def extract_images(sources: List[Mapping], workers: int = 0, force: bool = False, width: int = 2, height: int = 3):
     if not os.path.exists("temp"):
         os.makedirs("temp")
     if not os.path.exists("output"):
         os.makedirs("output")
-    pages = pdf2image.convert_from_path(filename, output_folder="temp")
-
-    for page_number, page in enumerate(pages):
-        for y_index in range(height):
-            for x_index in range(width):
-                index = width * height * page_number + width * y_index + x_index
-                if index >= len(names):
-                    return
-                x = DIVIDER_OFFSET_WIDTH + x_index * (DIVIDER_WIDTH + DIVIDER_MARGIN_WIDTH)
-                y = DIVIDER_OFFSET_HEIGHT + y_index * (DIVIDER_HEIGHT + DIVIDER_MARGIN_HEIGHT)
-                result = page.crop((x, y + LABEL_HEIGHT, x + DIVIDER_WIDTH, y + DIVIDER_HEIGHT))
-                name = names[index]
-                print(name)
-                result.save(f"output/{name}.png")
+    pages = plan_pages(sources, width, height, force)
+    # pdftoppm does the heavy lifting in its own process, so threads are enough to keep every core busy.
+    with ThreadPoolExecutor(max_workers=workers or os.cpu_count() or 1) as executor:
+        futures = [executor.submit(extract_page, filename, page_number, slots, width)
+                   for (filename, page_number), slots in sorted(pages.items())]
+        for future in futures:
+            future.result()
+    try:
+        os.rmdir("temp")
+    except OSError:
+        pass
 
 
 if __name__ == "__main__":
-    data = []
+    parser = argparse.ArgumentParser(description="Crop the divider art out of the PDFs listed in image_source.yaml.")
+    parser.add_argument("--workers", type=int, default=0, help="pages to convert at once, 0 for one per core")
+    parser.add_argument("--force", action="store_true", help="extract images even if they are newer than the PDF")
+    args = parser.parse_args()
     with open("image_source.yaml") as image_source:
-        data = yaml.load(image_source)
-    for source_file in data:
-        extract_images(source_file["path"], source_file["names"])
+        data = yaml.load(image_source, Loader=getattr(yaml, "CFullLoader", yaml.FullLoader))
+    extract_images(data, args.workers, args.force)
@@ -0,0 +1,283 @@
+import argparse
+import io
+import json
+import os
+import threading
+import time
+import zipfile
+
+import yaml
+
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Mapping, Optional, Tuple
+
+from divider import ART, FONTS, ICONS, PAGE_TEMPLATES, YAML_LOADER, BuildCache, Divider, DividerPDF, RenderCache
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8717
+DEFAULT_DECK = "cards.yaml"
+DEFAULT_CACHE_MB = 512
+SELECTION_KEYS = ("names", "card_types", "teams", "themes", "pages")
+
+
+class TileCache(RenderCache):
+    # Keyed like the incremental build's tiles, on the card, its format and the current stamps of the fonts, icons and
+    # art it uses, so a resource edited on disk is picked up by the next request.
+    def __init__(self, max_bytes: int):
+        super().__init__(max_size=1 << 20, max_bytes=max_bytes)
+        self.stamps = BuildCache()
+        # Stamps of every asset used since the server started, and of the icon directory for icons added or removed.
+        self.known_stamps: Dict[str, str] = {}
+        self.icons_stamp = self.stamps.asset_stamp(ICONS.directory)
+
+    def key(self, divider: Divider) -> str:
+        return self.stamps.tile_key(divider)
+
+    def new_request(self):
+        # Stamps are memoized for the length of a build, here that is one request. A changed stamp only gives a new
+        # key, the icon and font caches do not look at the files again, so they drop what changed here.
+        self.known_stamps.update(self.stamps.asset_stamps)
+        self.stamps = BuildCache()
+        changed = {os.path.normpath(path) for path, stamp in self.known_stamps.items()
+                   if self.stamps.asset_stamp(path) != stamp}
+        icons_stamp = self.stamps.asset_stamp(ICONS.directory)
+        if icons_stamp != self.icons_stamp or \
+                any(os.path.dirname(path) == os.path.normpath(ICONS.directory) for path in changed):
+            ICONS.refresh()
+        self.icons_stamp = icons_stamp
+        if changed:
+            FONTS.forget(changed)
+
+
+class DeckStore:
+    # Parsed decks by path, reloaded when the file changes. Inline cards are parsed against a deck's header, so they
+    # get its format and layout values and can use its anchors.
+    def __init__(self, max_size: int = 8):
+        self.max_size = max_size
+        self.entries: "OrderedDict[str, Tuple[Tuple[int, int], Tuple[List[Divider], Mapping], str]]" = OrderedDict()
+
+    def _entry(self, path: str):
+        stat = os.stat(path)
+        stamp = (stat.st_mtime_ns, stat.st_size)
+        entry = self.entries.get(path)
+        if entry is None or entry[0] != stamp:
+            with open(path) as deck_file:
+                header = deck_file.read().split("\ncards:")[0]
+            entry = (stamp, Divider.load(path), header)
+            self.entries[path] = entry
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+        self.entries.move_to_end(path)
+        return entry
+
+    def load(self, path: str) -> Tuple[List[Divider], Mapping]:
+        return self._entry(path)[1]
+
+    def load_inline(self, path: str, cards) -> Tuple[List[Divider], Mapping]:
+        header = self._entry(path)[2]
+        if isinstance(cards, str):
+            source = f"{header}\ncards:\n{cards}"
+        else:
+            source = f"{header}\ncards: {json.dumps(cards)}\n"
+        global_values, formatting, plan, expanded = Divider.parse(yaml.load(source, Loader=YAML_LOADER))
+        return [Divider(formatting, card, plan) for card in expanded], global_values
+
+
+class RenderServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address: Tuple[str, int], cache_bytes: int):
+        super().__init__(address, RenderHandler)
+        # Most of the budget goes to rendered tiles, then decoded art and the PNG bytes of tiles already sent. Icons
+        # are small and bounded by count.
+        self.tiles = TileCache(cache_bytes * 5 // 8)
+        ART.max_bytes = cache_bytes // 4
+        self.encoded: "OrderedDict[Tuple[str, int], bytes]" = OrderedDict()
+        self.encoded_size = 0
+        self.encoded_max_bytes = cache_bytes // 8
+        self.decks = DeckStore()
+        # The font, icon and art caches are shared module state, so renders take turns. Parsing the request and
+        # sending the response still happen in parallel.
+        self.lock = threading.Lock()
+        self.requests = 0
+
+    def select(self, request: Mapping) -> Tuple[List[Divider], Mapping, Optional[List[List[Tuple[int, int, int]]]]]:
+        deck = request.get("deck", DEFAULT_DECK)
+        if not os.path.isfile(deck):
+            raise FileNotFoundError(f"Could not find deck {deck}")
+        if request.get("cards") is not None:
+            dividers, global_properties = self.decks.load_inline(deck, request["cards"])
+        else:
+            dividers, global_properties = self.decks.load(deck)
+        global_properties = dict(global_properties, **request.get("options", {}))
+        # A process pool per request would cost more than it saves on the small batches this serves.
+        global_properties["workers"] = 1
+        pages = None
+        selection = {key: request[key] for key in SELECTION_KEYS if request.get(key) is not None}
+        if selection:
+            selected = Divider.select(dividers, global_properties, **selection)
+            if not selected:
+                raise Exception(f"No cards in {deck} match {selection}")
+            dividers, pages = Divider.selected_pages(dividers, selected, global_properties,
+                                                     request.get("keep_positions", False))
+        if global_properties["validate_assets"]:
+            Divider.validate(Divider.used_dividers(dividers, pages))
+        return dividers, global_properties, pages
+
+    def encode_tile(self, key: str, tile, compress_level: int) -> bytes:
+        data = self.encoded.get((key, compress_level))
+        if data is not None:
+            self.encoded.move_to_end((key, compress_level))
+            return data
+        encoded = io.BytesIO()
+        tile.save(encoded, "PNG", compress_level=compress_level)
+        data = encoded.getvalue()
+        self.encoded[(key, compress_level)] = data
+        self.encoded_size += len(data)
+        while self.encoded_size > self.encoded_max_bytes and len(self.encoded) > 1:
+            _, evicted = self.encoded.popitem(last=False)
+            self.encoded_size -= len(evicted)
+        return data
+
+    def render_tiles(self, dividers: List[Divider], compress_level: int) -> List[Tuple[str, bytes]]:
+        tiles = []
+        for index, (divider, tile) in enumerate(zip(dividers, Divider.render_all(dividers, 1, self.tiles))):
+            tiles.append((divider.preview_name(index), self.encode_tile(self.tiles.key(divider), tile, compress_level)))
+        return tiles
+
+    def render_pdf(self, dividers: List[Divider], global_properties: Mapping,
+                   pages: Optional[List[List[Tuple[int, int, int]]]]) -> bytes:
+        # Fronts and backs go into one document, in print order, even when separate_docs is set.
+        pdf = DividerPDF('P', "in", "Letter")
+        pdf.output_options = Divider.output_options(global_properties)
+        if global_properties["output_backend"] == "vector":
+            for placements in pages or Divider.page_placements(len(dividers), global_properties):
+                pdf.add_page()
+                Divider.render_vector_page(pdf, dividers, placements, global_properties)
+        else:
+            for page in Divider.iter_pages(dividers, global_properties, self.tiles, pages):
+                pdf.add_page()
+                pdf.image_pil(Divider.prepare_page(page, global_properties), 0, 0, 8.5, 11)
+        return pdf.output(dest="S").encode("latin-1")
+
+    def render(self, request: Mapping) -> Tuple[str, bytes]:
+        with self.lock:
+            self.requests += 1
+            self.tiles.new_request()
+            dividers, global_properties, pages = self.select(request)
+            if request.get("output", "pdf") == "pdf":
+                return "application/pdf", self.render_pdf(dividers, global_properties, pages)
+            dividers = Divider.used_dividers(dividers, pages)
+            # Previews favour latency, level 1 encodes five times faster than the default for a few percent more.
+            tiles = self.render_tiles(dividers, request.get("options", {}).get("compress_level", 1))
+        if len(tiles) == 1:
+            return "image/png", tiles[0][1]
+        archive = io.BytesIO()
+        with zipfile.ZipFile(archive, "w", zipfile.ZIP_STORED) as tiles_file:
+            for name, data in tiles:
+                tiles_file.writestr(name, data)
+        return "application/zip", archive.getvalue()
+
+    def stats(self) -> Dict:
+        with self.lock:
+            return {"requests": self.requests,
+                    "tiles": {"entries": len(self.tiles.entries), "bytes": self.tiles.size,
+                              "max_bytes": self.tiles.max_bytes, "hits": self.tiles.hits,
+                              "misses": self.tiles.misses},
+                    "art": {"entries": len(ART.entries), "bytes": ART.size, "max_bytes": ART.max_bytes},
+                    "encoded": {"entries": len(self.encoded), "bytes": self.encoded_size,
+                                "max_bytes": self.encoded_max_bytes},
+                    "icons": {"entries": len(ICONS.entries), "max_size": ICONS.max_size},
+                    "fonts": len(FONTS.fonts), "decks": list(self.decks.entries)}
+
+    def clear(self):
+        with self.lock:
+            self.tiles.clear()
+            self.encoded.clear()
+            self.encoded_size = 0
+            self.decks.entries.clear()
+            ART.clear()
+            ICONS.refresh()
+            PAGE_TEMPLATES.entries.clear()
+
+    def warm(self, deck: str):
+        # Renders every divider of a deck once, so its fonts, icons, art and tiles are in memory before the first
+        # request.
+        start = time.perf_counter()
+        dividers, _ = self.decks.load(deck)
+        with self.lock:
+            for _ in Divider.render_all(dividers, 1, self.tiles):
+                pass
+        print(f"Warmed {len(dividers)} dividers from {deck} in {time.perf_counter() - start:.2f}s")
+
+
+class RenderHandler(BaseHTTPRequestHandler):
+    server: RenderServer
+
+    def do_GET(self):
+        if self.path == "/stats":
+            self.respond(200, "application/json", json.dumps(self.server.stats()).encode("utf-8"))
+        else:
+            self.error(404, f"Unknown path {self.path}")
+
+    def do_POST(self):
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            request = json.loads(self.rfile.read(length) or b"{}")
+        except ValueError as e:
+            self.error(400, f"Could not read request: {e}")
+            return
+        if self.path == "/render":
+            start = time.perf_counter()
+            try:
+                content_type, body = self.server.render(request)
+            except FileNotFoundError as e:
+                self.error(404, str(e))
+                return
+            except Exception as e:
+                self.error(400, str(e))
+                return
+            self.respond(200, content_type, body, {"X-Render-Time": f"{(time.perf_counter() - start) * 1000:.1f}ms"})
+        elif self.path == "/clear":
+            self.server.clear()
+            self.respond(200, "application/json", b"{}")
+        else:
+            self.error(404, f"Unknown path {self.path}")
+
+    def respond(self, status: int, content_type: str, body: bytes, headers: Optional[Mapping[str, str]] = None):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def error(self, status: int, message: str):
+        self.respond(status, "application/json", json.dumps({"error": message}).encode("utf-8"))
+
+
+def main(host: str, port: int, cache_megabytes: int, warm: List[str]):
+    server = RenderServer((host, port), cache_megabytes * 1024 * 1024)
+    for deck in warm:
+        server.warm(deck)
+    print(f"Serving dividers on http://{host}:{server.server_address[1]}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve divider renders over HTTP, keeping assets and tiles in memory.")
+    parser.add_argument("--host", default=DEFAULT_HOST)
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--cache-mb", type=int, default=DEFAULT_CACHE_MB,
+                        help="memory for rendered tiles and decoded art, in megabytes")
+    parser.add_argument("--warm", nargs="*", default=[], metavar="DECK",
+                        help="render these decks once at startup so their assets are loaded")
+    args = parser.parse_args()
+    main(args.host, args.port, args.cache_mb, args.warm)